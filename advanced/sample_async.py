@@ -1,6 +1,8 @@
 import asyncio
 import time
 
+from sample_async_pool import bounded_as_completed
+
 
 async def main_simple():
     print('Hello ...')
@@ -36,6 +38,14 @@ async def main_gather():
     return _response
 
 
+async def main_pool():
+    print('\n**** main_pool ****')
+    # ワーカー数だけ同時に実行し、終わったものから順に受け取る
+    async for _id, _response in bounded_as_completed(get_message, ['201', '202', '203', '204'], workers=2):
+        print(_id, _response)
+    print(f'main_pool end, {time.strftime("%X")}')
+
+
 # 単に呼んでも`coroutine`オブジェクトが返ってくるだけで、実行はされない。
 coroutine = main_simple()
 print(coroutine)
@@ -55,3 +65,7 @@ asyncio.run(main_multiple())
 response = asyncio.run(main_gather())
 # 結果は単純なlist[dict]で返ってくる。
 print(response)
+
+# 大量の非同期処理は、ワーカー数を固定したプールで実行し、完了した順に結果を受け取る。
+# 同時に動くのは2件までなので、4件の完了に4秒掛かる。
+asyncio.run(main_pool())
@@ -0,0 +1,147 @@
+"""
+asyncioのマイクロバッチ
+get_message(_id)のような1件ずつのコルーチン呼び出しを、最大N件またはT秒分ためてから1回のバッチ呼び出しにまとめる。
+呼び出し側はこれまでどおり1件ずつawaitし、自分の分の結果（または例外）だけを受け取る。
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Generic, List, Optional, Set, Tuple, TypeVar, Union
+
+from sample_latency_stats import BucketHistogram
+
+K = TypeVar('K')
+R = TypeVar('R')
+
+
+class MicroBatcher(Generic[K, R]):
+    """
+    個別の呼び出しをまとめてバッチ関数に渡す
+
+    Args:
+        batch_func: キーのリストを受け取り、同じ順の結果のリスト、またはキーから結果へのdictを返すコルーチン関数
+        max_batch_size: 1回のバッチにまとめる最大件数。たまった時点ですぐに送る
+        max_wait_ms: 最初の1件が来てからバッチを送るまでの最大待ち時間（ミリ秒）
+    """
+
+    def __init__(self, batch_func: Callable[[List[K]], Awaitable[Union[List[R], Dict[K, R]]]],
+                 max_batch_size: int = 100, max_wait_ms: float = 10.0):
+        self._batch_func = batch_func
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait_ms / 1000
+        self._pending: List[Tuple[K, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+        self._batch_size = BucketHistogram([1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024])
+        self._queue_wait_ms = BucketHistogram([0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000])
+
+    async def submit(self, key: K) -> R:
+        """1件分を投入し、その結果を待つ"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((key, future, loop.time()))
+        if len(self._pending) >= self._max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch = self._pending[:self._max_batch_size]
+            self._pending = self._pending[self._max_batch_size:]
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: List[Tuple[K, asyncio.Future, float]]) -> None:
+        now = asyncio.get_running_loop().time()
+        self.batches += 1
+        self.items += len(batch)
+        self._batch_size.observe(len(batch))
+        for _, _, enqueued_at in batch:
+            self._queue_wait_ms.observe((now - enqueued_at) * 1000)
+
+        keys = [key for key, _, _ in batch]
+        try:
+            results = await self._batch_func(keys)
+            self._resolve(batch, results)
+        except BaseException as e:
+            # バッチ関数内のCancelledErrorやバッチのタスク自体の取り消しでも、待っている呼び出し元を取り残さない
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+
+    @staticmethod
+    def _resolve(batch: List[Tuple[K, asyncio.Future, float]], results: Union[List[R], Dict[K, R]]) -> None:
+        for index, (key, future, _) in enumerate(batch):
+            # 待っている呼び出し元がキャンセル済みなら、結果は捨てる
+            if future.done():
+                continue
+            if isinstance(results, dict):
+                if key in results:
+                    future.set_result(results[key])
+                else:
+                    future.set_exception(KeyError(key))
+            elif index < len(results):
+                future.set_result(results[index])
+            else:
+                future.set_exception(IndexError(f'batch result has no item for {key!r}'))
+
+    async def close(self) -> None:
+        """たまっている分を送り、実行中のバッチが終わるまで待つ"""
+        self._flush()
+        await asyncio.gather(*self._running, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'batch_size': self._batch_size.to_dict(),
+            'queue_wait_ms': self._queue_wait_ms.to_dict(),
+        }
+
+
+async def get_messages(ids: List[str]) -> Dict[str, dict]:
+    """バックエンドへの1往復で、複数件をまとめて取得する想定のコルーチン"""
+    await asyncio.sleep(0.05)
+    return {_id: {'message': 'success', 'id': _id} for _id in ids}
+
+
+async def get_message(_id: str) -> dict:
+    """1件ずつバックエンドに問い合わせる従来の呼び出し（比較用）"""
+    return (await get_messages([_id]))[_id]
+
+
+async def main():
+    print('**** MicroBatcher ****')
+    ids = [f'{i:04d}' for i in range(2000)]
+
+    # 従来どおり1件ずつ問い合わせると、2000往復になる
+    semaphore = asyncio.Semaphore(100)
+
+    async def limited(_id: str) -> dict:
+        async with semaphore:
+            return await get_message(_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(limited(_id) for _id in ids))
+    print(f'get_message x {len(ids)}: {time.perf_counter() - start:.3f} sec')
+
+    batcher: MicroBatcher[str, dict] = MicroBatcher(get_messages, max_batch_size=200, max_wait_ms=5)
+    start = time.perf_counter()
+    responses = await asyncio.gather(*(batcher.submit(_id) for _id in ids))
+    await batcher.close()
+    print(f'MicroBatcher    : {time.perf_counter() - start:.3f} sec, {responses[0]}')
+    print(batcher.stats())
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,214 @@
+"""
+イベントループの遅延と遅いコルーチンを計測するサンプルコード
+一定間隔のハートビートを仕掛け、予定した時刻と実際に起きた時刻の差（ループの遅延）を記録する。
+別スレッドの監視役は、ハートビートが閾値以上止まっていればループを止めている処理のスタックを記録する。
+@monitor.trackを付けたコルーチンは、呼び出しごとの経過時間とCPU時間を記録する。
+結果はsnapshot()でdictとして取り出せる。
+"""
+
+import asyncio
+import functools
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Generator, Optional, TypeVar
+
+from sample_latency_stats import SlidingWindow
+
+R = TypeVar('R')
+
+
+class _CoroutineStats:
+    __slots__ = ('calls', 'errors', 'wall_total', 'wall_max', 'cpu_total')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.wall_total = 0.0
+        self.wall_max = 0.0
+        self.cpu_total = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'wall_total': self.wall_total,
+            'wall_avg': self.wall_total / self.calls if self.calls else 0.0,
+            'wall_max': self.wall_max,
+            'cpu_total': self.cpu_total,
+        }
+
+
+class _TrackedCoroutine:
+    """コルーチンを1ステップずつ進めながら、その間のCPU時間だけを合計する"""
+
+    def __init__(self, coro: Any, stats: _CoroutineStats):
+        self._coro = coro
+        self._stats = stats
+
+    def __await__(self) -> Generator[Any, Any, Any]:
+        stats = self._stats
+        wall_start = time.perf_counter()
+        cpu = 0.0
+        send_value: Any = None
+        throw_value: Optional[BaseException] = None
+        try:
+            while True:
+                cpu_start = time.thread_time()
+                try:
+                    if throw_value is not None:
+                        yielded = self._coro.throw(throw_value)
+                    else:
+                        yielded = self._coro.send(send_value)
+                except StopIteration as e:
+                    return e.value
+                except BaseException:
+                    stats.errors += 1
+                    raise
+                finally:
+                    cpu += time.thread_time() - cpu_start
+                try:
+                    send_value, throw_value = (yield yielded), None
+                except BaseException as e:
+                    send_value, throw_value = None, e
+        finally:
+            wall = time.perf_counter() - wall_start
+            stats.calls += 1
+            stats.wall_total += wall
+            stats.wall_max = max(stats.wall_max, wall)
+            stats.cpu_total += cpu
+
+
+class LoopMonitor:
+    """
+    イベントループの監視
+
+    Args:
+        interval: ハートビートの間隔（秒）
+        slow_threshold: ループがこの秒数以上止まったら、止めている処理のスタックを記録する
+        history: 保持する遅延のサンプル数・遅い処理の件数
+    """
+
+    def __init__(self, interval: float = 0.05, slow_threshold: float = 0.1, history: int = 1000):
+        self._interval = interval
+        self._slow_threshold = slow_threshold
+        self._lags = SlidingWindow(history)
+        self._slow_callbacks: Deque[Dict[str, Any]] = deque(maxlen=history)
+        self._coroutines: Dict[str, _CoroutineStats] = {}
+        self._last_beat = time.monotonic()
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread_id = 0
+
+    async def start(self) -> None:
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name='loop-monitor', daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+        if self._watchdog is not None:
+            # joinはブロックするため、イベントループを止めないように別スレッドで待つ
+            await asyncio.to_thread(self._watchdog.join)
+
+    async def __aenter__(self) -> 'LoopMonitor':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    async def _heartbeat(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self._interval
+            await asyncio.sleep(self._interval)
+            # 予定より遅れて起きた分が、その間ループを占有していた処理による遅延
+            self._lags.record(max(loop.time() - expected, 0.0))
+            self._last_beat = time.monotonic()
+
+    def _watch(self) -> None:
+        reported_beat = None
+        while not self._stopped.wait(self._slow_threshold / 2):
+            last_beat = self._last_beat
+            blocked_for = time.monotonic() - last_beat - self._interval
+            if blocked_for < self._slow_threshold or reported_beat == last_beat:
+                continue
+            # 同じ停止を何度も記録しないよう、ハートビート1回につき1件だけ記録する
+            reported_beat = last_beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            self._slow_callbacks.append({
+                'detected_at': time.time(),
+                'blocked_for': blocked_for,
+                'stack': traceback.format_stack(frame) if frame is not None else [],
+            })
+
+    def track(self, func: Callable[..., Awaitable[R]]) -> Callable[..., Awaitable[R]]:
+        """コルーチン関数の呼び出しごとに、経過時間とCPU時間を記録するデコレータ"""
+        stats = self._coroutines.setdefault(func.__qualname__, _CoroutineStats())
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await _TrackedCoroutine(func(*args, **kwargs).__await__(), stats)
+        return wrapper
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'loop_lag': {
+                'samples': len(self._lags),
+                'last': self._lags.last() or 0.0,
+                'p50': self._lags.percentile(50) or 0.0,
+                'p99': self._lags.percentile(99) or 0.0,
+                'max': self._lags.percentile(100) or 0.0,
+            },
+            'slow_callbacks': list(self._slow_callbacks),
+            'coroutines': {name: stats.to_dict() for name, stats in self._coroutines.items()},
+        }
+
+
+monitor = LoopMonitor()
+
+
+@monitor.track
+async def get_message(_id: str):
+    print(f'get_message start. {_id}, {time.strftime("%X")}')
+    await asyncio.sleep(0.5)
+    print(f'get_message end. {_id}')
+    return {
+        'message': 'success'
+    }
+
+
+@monitor.track
+async def blocking_message(_id: str):
+    # asyncio.sleepではなくtime.sleepを呼んでしまい、イベントループを止める例
+    time.sleep(0.3)
+    sum(i * i for i in range(300_000))
+    return {
+        'message': 'success'
+    }
+
+
+async def main_gather():
+    async with monitor:
+        _response = await asyncio.gather(get_message('101'), get_message('102'), blocking_message('103'))
+    return _response
+
+
+if __name__ == '__main__':
+    print(asyncio.run(main_gather()))
+    snapshot = monitor.snapshot()
+    print(snapshot['loop_lag'])
+    print(snapshot['coroutines'])
+    for slow in snapshot['slow_callbacks']:
+        print(f"blocked for {slow['blocked_for']:.3f} sec at:")
+        print(''.join(slow['stack'][-2:]))
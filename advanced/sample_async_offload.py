@@ -0,0 +1,202 @@
+"""
+asyncioからブロッキング関数を呼ぶためのスレッドオフロード
+simple_get_requestやファイルI/Oのような同期関数を、サイズと名前を決めたThreadPoolExecutorで実行し、結果をawaitできるようにする。
+group()の中で起動した呼び出しはTaskGroupの管理下に入り、どれかが失敗するとまだスレッドで始まっていない呼び出しは取り消される。
+スレッドで実行中の呼び出しは止められないため、終わるのを待ってからキャンセルを伝える（group()を抜けた時点で実行中のものは残らない）。
+プールのサイズを決められるよう、待ち件数・実行中のスレッド数・待ち時間をstats()で返す。
+"""
+
+import asyncio
+import contextvars
+import functools
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Optional, TypeVar
+
+from sample_http_get import simple_get_request
+from sample_httpbin_server import serve_in_thread
+
+R = TypeVar('R')
+
+
+class ThreadOffloader:
+    """
+    ブロッキング関数を専用のスレッドプールで実行する
+
+    Args:
+        max_workers: スレッド数
+        name: スレッド名の接頭辞（スタックトレースやログでどのプールか分かるようにする）
+    """
+
+    def __init__(self, max_workers: int = 8, name: str = 'offload'):
+        self.max_workers = max_workers
+        self.name = name
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._peak_queued = 0
+        self._peak_active = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+
+    async def __aenter__(self) -> 'ThreadOffloader':
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        executor, self._executor = self._executor, None
+        # 待ち行列に残った分は取り消し、実行中の分が終わるのをイベントループを止めずに待つ
+        await asyncio.to_thread(functools.partial(executor.shutdown, wait=True, cancel_futures=True))
+
+    async def run(self, func: Callable[..., R], *args, **kwargs) -> R:
+        """
+        funcをプールのスレッドで実行し、その結果を返す
+        awaitしている側がキャンセルされた場合、まだ始まっていなければ実行せず、実行中なら終わるまで待ってからCancelledErrorを送出する
+        """
+        if self._executor is None:
+            raise RuntimeError('ThreadOffloader is not started')
+        with self._lock:
+            self._queued += 1
+            self._peak_queued = max(self._peak_queued, self._queued)
+        # asyncio.to_threadと同じく、呼び出し元のcontextvarsを引き継ぐ
+        context = contextvars.copy_context()
+        future = self._executor.submit(context.run, self._call, time.perf_counter(), func, args, kwargs)
+        future.add_done_callback(self._on_done)
+        wrapped = asyncio.wrap_future(future)
+        try:
+            # shieldしないと、キャンセルされた時点でスレッドの完了を待たずに戻ってしまう
+            return await asyncio.shield(wrapped)
+        except asyncio.CancelledError:
+            if not future.cancel():
+                await asyncio.wait([wrapped])
+                if not wrapped.cancelled():
+                    # スレッド側の例外は呼び出し元に届かないため、取り出して未処理の警告を抑える
+                    wrapped.exception()
+            raise
+
+    def _call(self, submitted: float, func: Callable[..., R], args: tuple, kwargs: dict) -> R:
+        queue_wait = time.perf_counter() - submitted
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+            self._peak_active = max(self._peak_active, self._active)
+            self._queue_wait_total += queue_wait
+            self._queue_wait_max = max(self._queue_wait_max, queue_wait)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _on_done(self, future: Future) -> None:
+        with self._lock:
+            if future.cancelled():
+                # スレッドで始まる前に取り消された
+                self._queued -= 1
+                self._cancelled += 1
+            elif future.exception() is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+
+    @asynccontextmanager
+    async def group(self) -> AsyncIterator['OffloadGroup']:
+        """TaskGroupの中でオフロードする。抜けるときは、失敗やキャンセルで抜ける場合も含め、スレッドで実行中の呼び出しがすべて終わるまで待つ"""
+        async with asyncio.TaskGroup() as task_group:
+            yield OffloadGroup(self, task_group)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            started = self._completed + self._failed + self._active
+            return {
+                'name': self.name,
+                'max_workers': self.max_workers,
+                'queued': self._queued,
+                'active': self._active,
+                'peak_queued': self._peak_queued,
+                'peak_active': self._peak_active,
+                'completed': self._completed,
+                'failed': self._failed,
+                'cancelled': self._cancelled,
+                'queue_wait_avg_ms': self._queue_wait_total / started * 1000 if started else 0.0,
+                'queue_wait_max_ms': self._queue_wait_max * 1000,
+            }
+
+
+class OffloadGroup:
+    """ThreadOffloader.group()が返す。spawnした呼び出しはTaskGroupのタスクになる"""
+
+    def __init__(self, offloader: ThreadOffloader, task_group: asyncio.TaskGroup):
+        self._offloader = offloader
+        self._task_group = task_group
+
+    def spawn(self, func: Callable[..., R], *args, **kwargs) -> 'asyncio.Task[R]':
+        name = f'{self._offloader.name}:{getattr(func, "__name__", repr(func))}'
+        return self._task_group.create_task(self._offloader.run(func, *args, **kwargs), name=name)
+
+
+def write_and_read(path: Path, size: int) -> int:
+    path.write_bytes(b'x' * size)
+    return len(path.read_bytes())
+
+
+def slow_task(seconds: float) -> float:
+    time.sleep(seconds)
+    return seconds
+
+
+def failing_task() -> None:
+    time.sleep(0.05)
+    raise ValueError('failed in thread')
+
+
+async def print_stats(offloader: ThreadOffloader, interval: float = 0.1) -> None:
+    while True:
+        stats = offloader.stats()
+        print(f'  queued={stats["queued"]:3d} active={stats["active"]}')
+        await asyncio.sleep(interval)
+
+
+async def main():
+    print('**** simple_get_request ****')
+    with serve_in_thread() as base_url:
+        async with ThreadOffloader(max_workers=8, name='http') as offloader:
+            monitor = asyncio.create_task(print_stats(offloader))
+            start = time.perf_counter()
+            async with offloader.group() as group:
+                tasks = [group.spawn(simple_get_request, f'{base_url}/delay/0.2') for _ in range(32)]
+            monitor.cancel()
+            print(f'{len(tasks)} requests: {time.perf_counter() - start:.3f} sec')
+            print(offloader.stats())
+
+    print('**** file I/O ****')
+    with tempfile.TemporaryDirectory() as tmpdir:
+        async with ThreadOffloader(max_workers=4, name='file') as offloader:
+            async with offloader.group() as group:
+                tasks = [group.spawn(write_and_read, Path(tmpdir) / f'{i}.txt', 1024 * 1024) for i in range(16)]
+            print(f'{sum(task.result() for task in tasks)} bytes')
+            print(offloader.stats())
+
+    print('**** cancel ****')
+    async with ThreadOffloader(max_workers=2, name='cancel') as offloader:
+        try:
+            async with offloader.group() as group:
+                group.spawn(failing_task)
+                for _ in range(20):
+                    group.spawn(slow_task, 0.2)
+        except* ValueError as eg:
+            print(f'failed: {eg.exceptions}')
+        # 待ち行列にあった分は実行されず、実行中だった分はgroup()を抜ける前に終わっている
+        print(offloader.stats())
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
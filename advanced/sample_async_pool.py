@@ -0,0 +1,139 @@
+"""
+ワーカー数を固定したasyncioのタスクプール
+asyncio.gatherに全コルーチンを一度に渡すと、10万件なら10万個のタスクが同時に作られ、全結果を最後まで保持することになる。
+ここでは固定数のワーカーが上限付きのキューからジョブを取り出し、完了した順に結果を返す。
+入力キューが埋まっている間はジョブの投入が止まる（バックプレッシャー）。
+"""
+
+import asyncio
+import time
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, List, Tuple, TypeVar, Union
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+FAIL_FAST = 'fail_fast'
+COLLECT_ERRORS = 'collect_errors'
+
+_DONE = object()
+
+
+def _cancelling() -> bool:
+    """実行中のタスク自身が取り消されている途中ならTrue（ジョブの中で起きたCancelledErrorとは区別する）"""
+    task = asyncio.current_task()
+    return task is not None and task.cancelling() > 0
+
+
+async def _iterate(items: Union[Iterable[T], AsyncIterable[T]]) -> AsyncIterator[T]:
+    if isinstance(items, AsyncIterable):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def bounded_as_completed(func: Callable[[T], Awaitable[R]], items: Union[Iterable[T], AsyncIterable[T]],
+                               workers: int = 10, queue_size: int = 0,
+                               policy: str = FAIL_FAST) -> AsyncIterator[Tuple[T, R]]:
+    """
+    itemsの各要素にfuncを適用し、完了した順に(item, 結果)を返す
+
+    Args:
+        func: 1件を処理するコルーチン関数
+        items: 入力（イテレータ・非同期イテレータでもよく、必要な分だけ読み進める）
+        workers: 同時に実行するワーカー数
+        queue_size: 入力キューの上限（0ならworkersの2倍）
+        policy: FAIL_FASTなら最初の例外で残りを取り消して送出する。
+                COLLECT_ERRORSなら全件を処理し終えてから、例外をまとめてExceptionGroupで送出する
+                （ジョブの中で起きたCancelledErrorを含む場合はBaseExceptionGroup）
+
+    途中でループを抜ける場合は、contextlib.aclosingで囲むとその時点でワーカーが止まる。
+    """
+    if policy not in (FAIL_FAST, COLLECT_ERRORS):
+        raise ValueError(f'Unknown policy: {policy}')
+
+    inputs: asyncio.Queue = asyncio.Queue(maxsize=queue_size or workers * 2)
+    # 結果のキューも上限付きにして、呼び出し側が受け取らない間はワーカーも止める
+    outputs: asyncio.Queue = asyncio.Queue(maxsize=workers)
+
+    async def produce() -> None:
+        try:
+            async for item in _iterate(items):
+                await inputs.put(item)
+        except (Exception, asyncio.CancelledError) as e:
+            if _cancelling():
+                raise
+            await outputs.put((None, None, e))
+        for _ in range(workers):
+            await inputs.put(_DONE)
+
+    async def work() -> None:
+        try:
+            while True:
+                item = await inputs.get()
+                if item is _DONE:
+                    return
+                try:
+                    result = await func(item)
+                except (Exception, asyncio.CancelledError) as e:
+                    # ジョブの中で起きたCancelledErrorも、黙って捨てずにそのジョブのエラーとして返す
+                    if _cancelling():
+                        raise
+                    await outputs.put((item, None, e))
+                else:
+                    await outputs.put((item, result, None))
+        finally:
+            # どのように抜けても終了を知らせる。呼び出し側の後片付けで取り消された場合は、受け取る側がもういない
+            if not _cancelling():
+                await outputs.put(_DONE)
+
+    tasks = [asyncio.create_task(produce())] + [asyncio.create_task(work()) for _ in range(workers)]
+    errors: List[BaseException] = []
+    try:
+        finished = 0
+        while finished < workers:
+            message = await outputs.get()
+            if message is _DONE:
+                finished += 1
+                continue
+            item, result, error = message
+            if error is None:
+                yield item, result
+            elif policy == FAIL_FAST:
+                raise error
+            else:
+                errors.append(error)
+    finally:
+        # 例外・呼び出し側の中断のいずれでも、残っているワーカーを止める
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    if errors:
+        # すべてExceptionならExceptionGroupになる
+        raise BaseExceptionGroup(f'{len(errors)} jobs failed', errors)
+
+
+async def _job(_id: int) -> dict:
+    await asyncio.sleep(0.01)
+    if _id % 25_000 == 24_999:
+        raise ValueError(f'job {_id} failed')
+    return {'message': 'success'}
+
+
+async def main():
+    print('**** bounded_as_completed ****')
+    start = time.perf_counter()
+    count = 0
+    try:
+        async for _id, response in bounded_as_completed(_job, range(100_000), workers=1000,
+                                                        policy=COLLECT_ERRORS):
+            count += 1
+    except* ValueError as eg:
+        print(f'{len(eg.exceptions)} errors. {eg.exceptions[0]!r}')
+    print(f'{count} results, {time.perf_counter() - start:.3f} sec')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,212 @@
+"""
+トークンバケットによるレート制限
+多数のコルーチン（またはスレッド）で1つのリミッターを共有し、上流へのリクエストを毎秒rate件に抑える。
+capacityまではまとめて流せる（バースト）。キーごとに別のバケットを持ち、使われなくなったキーは古い順に捨てる。
+待ちはトークンの前借り（予約）で表現するので、待っている呼び出しが何件あってもロックやポーリングは不要。
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Hashable, Optional
+
+
+class _Bucket:
+    """トークンバケット本体。tokensが負の場合は、先に予約された分の借りを表す"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, tokens: float, now: float) -> float:
+        """tokens分を予約し、使えるようになるまでの待ち秒数を返す"""
+        self._refill(now)
+        self.tokens -= tokens
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def refund(self, tokens: float, now: float) -> None:
+        """使わなかった予約を戻す"""
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens + tokens)
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Buckets:
+    """キーごとのバケット。max_keysを超えたら、満タンまで回復した（捨てても制限が緩まない）キーを古い順に捨てる"""
+
+    def __init__(self, rate: float, capacity: Optional[float], max_keys: int):
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        if self.capacity < 1:
+            raise ValueError('capacity must be at least 1')
+        self.max_keys = max_keys
+        self.evicted = 0
+        self._buckets: 'OrderedDict[Hashable, _Bucket]' = OrderedDict()
+
+    def get(self, key: Hashable, now: float) -> _Bucket:
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            self._buckets.move_to_end(key)
+            return bucket
+        bucket = self._buckets[key] = _Bucket(self.rate, self.capacity, now)
+        if len(self._buckets) > self.max_keys:
+            self._evict(now)
+        return bucket
+
+    def _evict(self, now: float) -> None:
+        for key in list(self._buckets):
+            if len(self._buckets) <= self.max_keys:
+                break
+            if self._buckets[key].is_idle(now):
+                del self._buckets[key]
+                self.evicted += 1
+
+    def check(self, tokens: float) -> None:
+        if tokens > self.capacity:
+            raise ValueError(f'tokens ({tokens}) must not exceed capacity ({self.capacity})')
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'rate': self.rate,
+            'capacity': self.capacity,
+            'keys': len(self._buckets),
+            'evicted': self.evicted,
+        }
+
+
+class AsyncRateLimiter:
+    """
+    asyncio用のレートリミッター
+
+    Args:
+        rate: 1秒あたりに補充するトークン数
+        capacity: バケットの容量（バーストで流せる上限）。省略時はrate
+        max_keys: 保持するキーの上限
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, max_keys: int = 1024):
+        self._buckets = _Buckets(rate, capacity, max_keys)
+        self.acquired = 0
+        self.waited = 0
+
+    async def acquire(self, key: Hashable = None, tokens: float = 1) -> None:
+        self._buckets.check(tokens)
+        loop = asyncio.get_running_loop()
+        bucket = self._buckets.get(key, loop.time())
+        delay = bucket.reserve(tokens, loop.time())
+        if delay > 0:
+            self.waited += 1
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                # キャンセルされた分の予約は、後ろで待っている呼び出しに譲る
+                bucket.refund(tokens, loop.time())
+                raise
+        self.acquired += 1
+
+    async def __aenter__(self) -> 'AsyncRateLimiter':
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._buckets.stats(), acquired=self.acquired, waited=self.waited)
+
+
+class RateLimiter:
+    """
+    スレッドから使う同期版のレートリミッター。引数はAsyncRateLimiterと同じ
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, max_keys: int = 1024):
+        self._buckets = _Buckets(rate, capacity, max_keys)
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.waited = 0
+
+    def acquire(self, key: Hashable = None, tokens: float = 1) -> None:
+        self._buckets.check(tokens)
+        with self._lock:
+            now = time.monotonic()
+            delay = self._buckets.get(key, now).reserve(tokens, now)
+            self.acquired += 1
+            if delay > 0:
+                self.waited += 1
+        # 予約はロックの中で済んでいるので、待つのはロックの外でよい
+        if delay > 0:
+            time.sleep(delay)
+
+    def __enter__(self) -> 'RateLimiter':
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._buckets.stats(), acquired=self.acquired, waited=self.waited)
+
+
+async def benchmark_async(tasks: int = 10_000, rate: float = 2000, capacity: float = 100):
+    limiter = AsyncRateLimiter(rate, capacity)
+    done = []
+
+    async def call():
+        await limiter.acquire()
+        done.append(time.perf_counter())
+
+    start = time.perf_counter()
+    await asyncio.gather(*(call() for _ in range(tasks)))
+    elapsed = time.perf_counter() - start
+    # 最初のcapacity件はバーストで流れるので、それ以降の件数と時間で実効レートを測る
+    sustained = (tasks - capacity - 1) / (done[-1] - done[int(capacity)])
+    print(f'async  : {tasks} tasks in {elapsed:.3f} sec '
+          f'(expected {(tasks - capacity) / rate:.3f}), sustained {sustained:.0f}/sec (rate {rate:g})')
+    print(limiter.stats())
+
+
+async def benchmark_keys(keys: int = 50, calls: int = 10, rate: float = 100, max_keys: int = 10):
+    limiter = AsyncRateLimiter(rate, capacity=5, max_keys=max_keys)
+    start = time.perf_counter()
+    for key in range(keys):
+        await asyncio.gather(*(limiter.acquire(f'host-{key}') for _ in range(calls)))
+    print(f'keys   : {keys} keys x {calls} calls in {time.perf_counter() - start:.3f} sec')
+    await asyncio.sleep(0.1)
+    await limiter.acquire('host-last')
+    print(limiter.stats())
+
+
+def benchmark_threads(calls: int = 1000, workers: int = 32, rate: float = 500, capacity: float = 50):
+    limiter = RateLimiter(rate, capacity)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda _: limiter.acquire(), range(calls)))
+    elapsed = time.perf_counter() - start
+    print(f'threads: {calls} calls in {elapsed:.3f} sec (expected {(calls - capacity) / rate:.3f})')
+    print(limiter.stats())
+
+
+if __name__ == '__main__':
+    print('**** AsyncRateLimiter ****')
+    asyncio.run(benchmark_async())
+    asyncio.run(benchmark_keys())
+    print('**** RateLimiter ****')
+    benchmark_threads()
@@ -0,0 +1,220 @@
+"""
+条件付きリクエストで再検証するレスポンスキャッシュのサンプルコード
+get_json_apiのレスポンスを、パラメータを付けた最終的なURLと関係するヘッダーをキーにキャッシュする。
+TTL内ならリクエストせずに返し、TTLを過ぎたらIf-None-Match/If-Modified-Sinceで再検証する。
+304が返れば本文を再取得せずに済む。
+"""
+
+import json
+import shelve
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from sample_httpbin_server import serve_in_thread
+
+# キャッシュのキーに含めるヘッダー（レスポンスの内容が変わりうるもの）
+_VARY_HEADERS = ('Accept', 'Accept-Encoding', 'Accept-Language')
+
+
+class CacheEntry(NamedTuple):
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    stored_at: float
+
+    @property
+    def revalidatable(self) -> bool:
+        return self.etag is not None or self.last_modified is not None
+
+
+class ResponseCache:
+    """
+    LRUとTTLでサイズを抑えたレスポンスキャッシュ
+    pathを指定すると、shelveでディスクにも保存し、プロセスを再起動しても再検証に使える。
+    LRUでメモリから捨てたエントリはディスクからも消すため、ディスク上の件数も際限なく増えることはない。
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 60.0, path: Optional[str] = None):
+        """
+        Args:
+            max_entries: メモリ上に保持する最大件数。超えると最も使われていないものから（ディスクからも）捨てる
+            ttl: リクエストせずにキャッシュを返す秒数
+            path: ディスクに保存する場合のshelveのファイル名
+        """
+        self._entries: 'OrderedDict[str, CacheEntry]' = OrderedDict()
+        self._max_entries = max_entries
+        self.ttl = ttl
+        self._shelf = shelve.open(path) if path else None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            elif self._shelf is not None and key in self._shelf:
+                entry = self._shelf[key]
+                self._put(key, entry, persist=False)
+            if entry is not None and not entry.revalidatable and self.is_stale(entry):
+                # 再検証できない古いエントリは使い道がないため捨てる
+                self._delete(key)
+                return None
+            return entry
+
+    def lookup(self, key: str) -> Tuple[Optional[CacheEntry], bool]:
+        """エントリと、それがTTL内かどうかを返す。TTL内ならヒットとして数える"""
+        entry = self.get(key)
+        fresh = entry is not None and not self.is_stale(entry)
+        if fresh:
+            with self._lock:
+                self.hits += 1
+        return entry, fresh
+
+    def put(self, key: str, entry: CacheEntry) -> None:
+        with self._lock:
+            self._put(key, entry, persist=True)
+
+    def store(self, key: str, entry: CacheEntry) -> None:
+        """取得し直したレスポンスを保存し、ミスとして数える"""
+        with self._lock:
+            self.misses += 1
+            self._put(key, entry, persist=True)
+
+    def revalidated(self, key: str, entry: CacheEntry) -> CacheEntry:
+        """304で変更なしと分かったエントリの保存時刻を更新し、再検証として数える"""
+        entry = entry._replace(stored_at=time.time())
+        with self._lock:
+            self.revalidations += 1
+            self._put(key, entry, persist=True)
+        return entry
+
+    def _put(self, key: str, entry: CacheEntry, persist: bool) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            if self._shelf is not None and evicted in self._shelf:
+                del self._shelf[evicted]
+        if persist and self._shelf is not None:
+            self._shelf[key] = entry
+
+    def _delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+        if self._shelf is not None and key in self._shelf:
+            del self._shelf[key]
+
+    def is_stale(self, entry: CacheEntry) -> bool:
+        return time.time() - entry.stored_at >= self.ttl
+
+    def stats(self) -> Dict[str, int]:
+        """監視用のカウンター"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidations': self.revalidations,
+            }
+
+    def close(self) -> None:
+        if self._shelf is not None:
+            self._shelf.close()
+
+    def __enter__(self) -> 'ResponseCache':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+_default_cache = ResponseCache()
+
+
+def cached_get_json_api(url: str, params: Optional[Dict[str, str]] = None,
+                        cache: Optional[ResponseCache] = None) -> Dict[str, Any]:
+    """
+    キャッシュ付きのJSON APIへのGETリクエスト
+
+    Args:
+        url: APIのURL
+        params: クエリパラメータ
+        cache: 使用するキャッシュ（省略時はモジュール共通のキャッシュ）
+
+    Returns:
+        JSONレスポンス
+    """
+    cache = cache or _default_cache
+    if params:
+        query_string = urllib.parse.urlencode(params)
+        url = f"{url}?{query_string}"
+
+    headers = {
+        'User-Agent': 'Python urllib sample',
+        'Accept': 'application/json'
+    }
+    key = '\n'.join([url] + [f'{name}: {headers[name]}' for name in _VARY_HEADERS if name in headers])
+
+    entry, fresh = cache.lookup(key)
+    if fresh:
+        return json.loads(entry.body)
+
+    request_headers = dict(headers)
+    if entry is not None:
+        if entry.etag:
+            request_headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            request_headers['If-Modified-Since'] = entry.last_modified
+
+    request = urllib.request.Request(url, headers=request_headers)
+
+    try:
+        with urllib.request.urlopen(request) as response:
+            body = response.read()
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+        cache.store(key, CacheEntry(body, etag, last_modified, time.time()))
+        return json.loads(body.decode('utf-8'))
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and entry is not None:
+            # 変更なし。本文は手元のものを使い、保存時刻だけ更新する
+            return json.loads(cache.revalidated(key, entry).body)
+        print(f"HTTP Error: {e.code} {e.reason}")
+        raise
+    except urllib.error.URLError as e:
+        print(f"URL Error: {e.reason}")
+        raise
+    except json.JSONDecodeError as e:
+        print(f"JSON Decode Error: {e}")
+        raise
+
+
+def main():
+    """メイン実行関数"""
+
+    print("=== レスポンスキャッシュのサンプル ===")
+
+    with serve_in_thread() as base_url, ResponseCache(ttl=0.5) as cache:
+        url = f'{base_url}/etag/abc123'
+
+        # 1回目はミス、2回目はTTL内なのでリクエストせずにヒットする
+        cached_get_json_api(url, cache=cache)
+        cached_get_json_api(url, cache=cache)
+
+        # TTLを過ぎるとIf-None-Matchで再検証し、304なら本文を再取得しない
+        time.sleep(0.6)
+        response = cached_get_json_api(url, cache=cache)
+        print(f"Response: {response}")
+
+        print(cache.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""
+分割・並列・再開可能なファイルダウンロードのサンプルコード
+Content-Length/Accept-Rangesを確認し、N個のバイト範囲を並列に取得して、事前に確保したファイルへos.pwriteで書き込む。
+進捗はサイドカーの状態ファイルに保存し、中断しても続きからダウンロードできる。
+再開するのは、保存先のファイルが残っていて、リモートのファイルが変わっていない（ETag・Last-Modifiedが同じ）場合だけ。
+最後にファイルを読みながらハッシュを計算して検証する。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple, Optional
+
+from sample_http_get import download_file
+from sample_httpbin_server import serve_in_thread
+
+
+class RemoteFile(NamedTuple):
+    length: Optional[int]
+    accept_ranges: bool
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+def probe(url: str) -> RemoteFile:
+    """
+    HEADリクエストで、ファイルサイズとRangeリクエストに対応しているか、変更を検知するためのETag・Last-Modifiedを調べる
+
+    Returns:
+        Content-Length（不明ならNone）、Accept-Ranges: bytesかどうか、ETag、Last-Modified
+    """
+    request = urllib.request.Request(url, method='HEAD')
+    with urllib.request.urlopen(request) as response:
+        length = response.headers.get('Content-Length')
+        return RemoteFile(
+            int(length) if length is not None else None,
+            response.headers.get('Accept-Ranges', '').lower() == 'bytes',
+            response.headers.get('ETag'),
+            response.headers.get('Last-Modified'),
+        )
+
+
+def file_hash(filename: str, algorithm: str = 'sha256', chunk_size: int = 1024 * 1024) -> str:
+    """ファイル全体をメモリに載せずに、少しずつ読みながらハッシュを計算する"""
+    digest = hashlib.new(algorithm)
+    with open(filename, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _DownloadState:
+    """
+    サイドカーの状態ファイル（<filename>.state.json）
+    セグメントごとに[開始, 終了, 次に書き込む位置]を持つ。
+    """
+
+    def __init__(self, path: str, url: str, remote: RemoteFile, segments: List[List[int]]):
+        self.path = path
+        self.url = url
+        self.remote = remote
+        self.segments = segments
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load_or_create(cls, path: str, url: str, remote: RemoteFile, segment_count: int,
+                       filename: str) -> '_DownloadState':
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                saved = json.load(f)
+            # 同じURL・同じ内容のリモートファイルで、書き込み途中のファイルも残っている場合だけ、前回の続きから再開する
+            same_remote = saved['url'] == url and saved['length'] == remote.length and \
+                saved.get('etag') == remote.etag and saved.get('last_modified') == remote.last_modified
+            if same_remote and os.path.exists(filename) and os.stat(filename).st_size == remote.length:
+                return cls(path, url, remote, saved['segments'])
+
+        length = remote.length or 0
+        size = -(-length // segment_count)
+        segments = [[start, min(start + size, length) - 1, start] for start in range(0, length, size)]
+        return cls(path, url, remote, segments)
+
+    def advance(self, number: int, offset: int) -> None:
+        with self._lock:
+            self.segments[number][2] = offset
+            self._save()
+
+    def _save(self) -> None:
+        # 書き込み途中で中断しても壊れないよう、一時ファイルに書いてから置き換える
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'url': self.url, 'length': self.remote.length, 'etag': self.remote.etag,
+                       'last_modified': self.remote.last_modified, 'segments': self.segments}, f)
+        os.replace(tmp_path, self.path)
+
+
+def _download_segment(url: str, fd: int, state: _DownloadState, number: int, chunk_size: int) -> None:
+    start, end, offset = state.segments[number]
+    if offset > end:
+        return
+    headers = {'Range': f'bytes={offset}-{end}'}
+    # 途中でリモートのファイルが変わった場合は、206ではなく全体（200）が返るようにする
+    validator = state.remote.etag or state.remote.last_modified
+    if validator:
+        headers['If-Range'] = validator
+    request = urllib.request.Request(url, headers=headers)
+    with urllib.request.urlopen(request) as response:
+        if response.getcode() != 206:
+            raise ValueError(f'Range request is not supported. status={response.getcode()}')
+        while offset <= end:
+            chunk = response.read(min(chunk_size, end - offset + 1))
+            if not chunk:
+                raise ConnectionError(f'Connection closed at {offset} (segment {start}-{end}).')
+            os.pwrite(fd, chunk, offset)
+            offset += len(chunk)
+            state.advance(number, offset)
+
+
+def download_file_segmented(url: str, filename: str, segments: int = 4, chunk_size: int = 1024 * 1024,
+                            expected_sha256: Optional[str] = None) -> str:
+    """
+    ファイルを分割して並列にダウンロードする
+
+    Args:
+        url: ダウンロード元URL
+        filename: 保存先ファイル名
+        segments: 並列に取得するバイト範囲の数
+        chunk_size: 1回に読み込んで書き込むバイト数（状態ファイルもこの単位で更新する）
+        expected_sha256: 期待するSHA-256。一致しなければValueErrorを送出する
+
+    Returns:
+        ダウンロードしたファイルのSHA-256
+    """
+    remote = probe(url)
+    if not remote.length or not remote.accept_ranges:
+        # 分割できないサーバーでは、従来どおり1本の接続でダウンロードする
+        download_file(url, filename)
+    else:
+        state = _DownloadState.load_or_create(f'{filename}.state.json', url, remote, segments, filename)
+        fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # 最終サイズの領域を先に確保しておき、各セグメントは自分の位置に直接書き込む
+            os.ftruncate(fd, remote.length)
+            with ThreadPoolExecutor(max_workers=len(state.segments), thread_name_prefix='download') as executor:
+                futures = [executor.submit(_download_segment, url, fd, state, number, chunk_size)
+                           for number in range(len(state.segments))]
+                for future in futures:
+                    future.result()
+        finally:
+            os.close(fd)
+        os.remove(state.path)
+
+    digest = file_hash(filename)
+    if expected_sha256 is not None and digest != expected_sha256:
+        raise ValueError(f'Hash mismatch. expected={expected_sha256}, actual={digest}')
+    print(f"File downloaded: {filename}")
+    return digest
+
+
+def main():
+    """メイン実行関数"""
+
+    print("=== 分割ダウンロードのサンプル ===")
+
+    size = 32 * 1024 * 1024
+    filename = 'download.bin'
+    with serve_in_thread() as base_url:
+        url = f'{base_url}/bytes/{size}'
+
+        start = time.perf_counter()
+        download_file(url, filename)
+        expected = file_hash(filename)
+        print(f"urlretrieve: {time.perf_counter() - start:.3f} sec")
+        os.remove(filename)
+
+        start = time.perf_counter()
+        download_file_segmented(url, filename, segments=4, expected_sha256=expected)
+        print(f"segmented  : {time.perf_counter() - start:.3f} sec")
+        os.remove(filename)
+
+        # 途中まで進んだ状態ファイルがあれば、残りの範囲だけを取得する
+        state = _DownloadState.load_or_create(f'{filename}.state.json', url, probe(url), 4, filename)
+        request = urllib.request.Request(url, headers={'Range': f'bytes=0-{size // 8 - 1}'})
+        with urllib.request.urlopen(request) as response, open(filename, 'wb') as f:
+            f.write(response.read())
+            f.truncate(size)
+        state.advance(0, size // 8)
+        download_file_segmented(url, filename, segments=4, expected_sha256=expected)
+        print("resumed download verified.")
+
+        # 保存先のファイルが消えていれば、状態ファイルがあっても最初からダウンロードし直す
+        state.advance(0, size // 8)
+        os.remove(filename)
+        download_file_segmented(url, filename, segments=4, expected_sha256=expected)
+        print("restarted download verified.")
+        os.remove(filename)
+
+
+if __name__ == '__main__':
+    main()
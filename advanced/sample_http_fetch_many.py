@@ -0,0 +1,123 @@
+"""
+asyncioで複数のJSON APIを並行して取得するサンプルコード
+get_json_api（コネクションプール版）をスレッドプール上で実行し、
+全体・ホストごとの同時実行数を制限しながら、完了した順に結果を返す。
+"""
+
+import asyncio
+import time
+import urllib.parse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Deque, Dict, Iterable, Optional, Tuple
+
+from sample_httpbin_server import serve_in_thread
+from sample_http_pool import HTTPConnectionPool, get_json_api
+
+
+async def fetch_many(urls: Iterable[str], concurrency: int = 10, per_host: int = 4,
+                     timeout: Optional[float] = None, request_timeout: float = 10.0,
+                     params: Optional[Dict[str, str]] = None,
+                     return_exceptions: bool = False, max_buffered: int = 1000) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    複数のURLにget_json_apiと同じヘッダーでGETし、完了した順に(url, JSON)を返す
+
+    Args:
+        urls: 取得するURL。イテレータでもよく、必要になった分だけ読み進める
+        concurrency: 全体の同時実行数
+        per_host: ホストごとの同時実行数
+        timeout: 全体のタイムアウト秒数。超えると実行中・未実行のリクエストを取り消してTimeoutErrorを送出する
+        request_timeout: 1リクエストあたりの接続・読み込みのタイムアウト秒数
+        params: 全URLに付けるクエリパラメータ
+        return_exceptions: Trueなら失敗したURLも(url, 例外)として返す。Falseなら最初の例外を送出する
+        max_buffered: 同時実行数の上限に達しているホストのURLを、先読みして待たせておく最大件数
+
+    失敗時の例外はget_json_apiと同じ（HTTPErrorまたはURLError）。
+    """
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    url_iterator = iter(urls)
+    exhausted = False
+    pending: Dict['asyncio.Task[Any]', Tuple[str, str]] = {}
+    host_active: Dict[str, int] = {}
+    # 空きのないホストのURLはタスクにせずホストごとに待たせ、ほかのホストのURLを先に実行する
+    held: Dict[str, Deque[str]] = {}
+    held_count = 0
+
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='fetch_many')
+    pool = HTTPConnectionPool(max_size=per_host, timeout=request_timeout)
+
+    def start(url: str, host: str) -> None:
+        host_active[host] = host_active.get(host, 0) + 1
+        future = loop.run_in_executor(executor, get_json_api, url, params, pool)
+        pending[asyncio.ensure_future(future)] = (url, host)
+
+    def fill() -> None:
+        nonlocal exhausted, held_count
+        # 待たせているURLのうち、ホストに空きができたものから実行する
+        for host in list(held):
+            queue = held[host]
+            while queue and len(pending) < concurrency and host_active.get(host, 0) < per_host:
+                start(queue.popleft(), host)
+                held_count -= 1
+            if not queue:
+                del held[host]
+        # 5万件を一度にタスク化せず、同時実行数の分だけタスクを作っておく
+        while len(pending) < concurrency and not exhausted and held_count < max_buffered:
+            url = next(url_iterator, None)
+            if url is None:
+                exhausted = True
+                return
+            host = urllib.parse.urlsplit(url).netloc
+            if host_active.get(host, 0) < per_host:
+                start(url, host)
+            else:
+                held.setdefault(host, deque()).append(url)
+                held_count += 1
+
+    try:
+        fill()
+        while pending:
+            wait_timeout = None if deadline is None else max(deadline - loop.time(), 0)
+            done, _ = await asyncio.wait(pending, timeout=wait_timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f'fetch_many timed out after {timeout} seconds.')
+            for task in done:
+                url, host = pending.pop(task)
+                host_active[host] -= 1
+                try:
+                    result = task.result()
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    result = e
+                yield url, result
+            fill()
+    finally:
+        # タイムアウト・例外・呼び出し側の中断のいずれでも、残りのリクエストを取り消す
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        executor.shutdown(wait=False, cancel_futures=True)
+        pool.close()
+
+
+async def main():
+    with serve_in_thread() as base_url:
+        urls = [f'{base_url}/get?id={i}' for i in range(200)]
+
+        print('**** fetch_many ****')
+        start = time.perf_counter()
+        count = 0
+        async for url, response in fetch_many(urls, concurrency=20, per_host=20):
+            count += 1
+        print(f'{count} documents, {time.perf_counter() - start:.3f} sec')
+
+        print('**** fetch_many (return_exceptions) ****')
+        async for url, response in fetch_many([f'{base_url}/status/404', f'{base_url}/get'],
+                                              return_exceptions=True):
+            print(url, response if isinstance(response, Exception) else response['url'])
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -6,7 +6,9 @@ HTTP GETリクエストのサンプルコード
 import urllib.request
 import urllib.parse
 import json
-from typing import Dict, Any, Optional
+import sys
+import zlib
+from typing import Dict, Any, Optional, Union
 
 
 def simple_get_request(url: str) -> str:
@@ -23,24 +25,93 @@ def simple_get_request(url: str) -> str:
         return response.read().decode('utf-8')
 
 
-def get_request_with_headers(url: str, headers: Dict[str, str]) -> Dict[str, Any]:
+def _decompressor(content_encoding: str):
+    """Content-Encodingに対応する逐次展開オブジェクトを返す（非圧縮ならNone）"""
+    if content_encoding == 'gzip':
+        return zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    if content_encoding == 'deflate':
+        return zlib.decompressobj(wbits=zlib.MAX_WBITS)
+    return None
+
+
+def _is_zlib_header(head: bytes) -> bool:
+    """zlib形式（RFC 1950）のヘッダーか。圧縮方式が8（deflate）で、先頭2バイトが31の倍数になる"""
+    return head[0] & 0x0f == 8 and (head[0] << 8 | head[1]) % 31 == 0
+
+
+def _read_body(response, content_encoding: str, chunk_size: int = 64 * 1024) -> bytearray:
+    """
+    レスポンス本文を少しずつ読み込み、圧縮されていれば届いた分から展開する
+
+    Args:
+        response: urlopenのレスポンス
+        content_encoding: レスポンスのContent-Encoding
+        chunk_size: 1回に読み込むバイト数
+    """
+    body = bytearray()
+    decompressor = _decompressor(content_encoding)
+    # deflateはzlibヘッダーなし（生のdeflate）で返すサーバーもあるため、先頭2バイトが揃うまで形式を決めない
+    head = bytearray() if content_encoding == 'deflate' else None
+    while chunk := response.read(chunk_size):
+        if head is not None:
+            head += chunk
+            if len(head) < 2:
+                continue
+            if not _is_zlib_header(head):
+                decompressor = zlib.decompressobj(wbits=-zlib.MAX_WBITS)
+            chunk, head = bytes(head), None
+        if decompressor is None:
+            body += chunk
+            continue
+        body += decompressor.decompress(chunk)
+    if head:
+        # 2バイト未満の本文はzlibヘッダーを持ち得ないため、生のdeflateとして展開する
+        decompressor = zlib.decompressobj(wbits=-zlib.MAX_WBITS)
+        body += decompressor.decompress(bytes(head))
+    if decompressor is not None:
+        body += decompressor.flush()
+    return body
+
+
+def get_request_with_headers(url: str, headers: Dict[str, str], compressed: bool = True,
+                             body_format: str = 'str', opener: Optional[Any] = None) -> Dict[str, Any]:
     """
     ヘッダー付きGETリクエスト
     
     Args:
         url: リクエスト先のURL
         headers: HTTPヘッダー
+        compressed: Trueならgzip/deflateでの圧縮転送を要求し、受信しながら展開する
+        body_format: 本文の返し方。'str'はUTF-8でデコード、'bytes'・'memoryview'はデコードせずに返す
+        opener: open(request)を持つオブジェクト（build_opener()の戻り値など）。省略時はurlopenを使う
         
     Returns:
         レスポンス情報の辞書
     """
-    request = urllib.request.Request(url, headers=headers)
+    if body_format not in ('str', 'bytes', 'memoryview'):
+        raise ValueError(f'Unsupported body_format: {body_format}')
+
+    request_headers = dict(headers)
+    if compressed:
+        request_headers.setdefault('Accept-Encoding', 'gzip, deflate')
+    request = urllib.request.Request(url, headers=request_headers)
     
-    with urllib.request.urlopen(request) as response:
+    open_request = opener.open if opener is not None else urllib.request.urlopen
+    with open_request(request) as response:
+        content_encoding = response.headers.get('Content-Encoding', '').strip().lower()
+        body = _read_body(response, content_encoding if compressed else '')
+        content: Union[str, bytes, memoryview]
+        if body_format == 'memoryview':
+            # bytearrayをコピーせずにそのまま参照する
+            content = memoryview(body)
+        elif body_format == 'bytes':
+            content = bytes(body)
+        else:
+            content = body.decode('utf-8')
         return {
             'status_code': response.getcode(),
             'headers': dict(response.headers),
-            'content': response.read().decode('utf-8')
+            'content': content
         }
 
 
@@ -93,15 +164,20 @@ def download_file(url: str, filename: str) -> None:
     print(f"File downloaded: {filename}")
 
 
-def main():
-    """メイン実行関数"""
+def main(base_url: str = 'https://httpbin.org'):
+    """
+    メイン実行関数
+    
+    Args:
+        base_url: httpbin互換サーバーのURL（ローカルではsample_httpbin_server.pyを起動して指定する）
+    """
     
     print("=== HTTP GETリクエストサンプル ===")
     
     # 1. シンプルなGETリクエスト
     print("1. シンプルなGETリクエスト")
     try:
-        response = simple_get_request('https://httpbin.org/get')
+        response = simple_get_request(f'{base_url}/get')
         print(f"Response length: {len(response)} characters")
         print(f"First 200 chars: {response[:200]}...")
     except Exception as e:
@@ -114,13 +190,22 @@ def main():
             'User-Agent': 'Python Sample Client 1.0',
             'Accept': 'application/json'
         }
-        response = get_request_with_headers('https://httpbin.org/headers', headers)
+        response = get_request_with_headers(f'{base_url}/headers', headers)
         print(f"Status Code: {response['status_code']}")
         print(f"Content-Type: {response['headers'].get('Content-Type')}")
         print(f"Response: {response['content'][:200]}...")
     except Exception as e:
         print(f"Error: {e}")
     
+    # 2-2. 圧縮転送（gzip）を受信しながら展開し、デコードせずにbytesで受け取る
+    print("2-2. 圧縮転送（gzip）")
+    try:
+        response = get_request_with_headers(f'{base_url}/gzip', {}, body_format='bytes')
+        print(f"Content-Encoding: {response['headers'].get('Content-Encoding')}")
+        print(f"Response: {response['content'][:200]!r}...")
+    except Exception as e:
+        print(f"Error: {e}")
+    
     # 3. JSON APIリクエスト（パラメータ付き）
     print("3. JSON APIリクエスト（パラメータ付き）")
     try:
@@ -128,7 +213,7 @@ def main():
             'param1': 'value1',
             'param2': 'value2'
         }
-        response = get_json_api('https://httpbin.org/get', params)
+        response = get_json_api(f'{base_url}/get', params)
         print(f"URL: {response['url']}")
         print(f"Args: {response['args']}")
         print(f"Headers User-Agent: {response['headers']['User-Agent']}")
@@ -138,7 +223,7 @@ def main():
     # 4. エラーハンドリングの例
     print("4. エラーハンドリングの例（存在しないURL）")
     try:
-        response = simple_get_request('https://httpbin.org/status/404')
+        response = simple_get_request(f'{base_url}/status/404')
     except urllib.error.HTTPError as e:
         print(f"HTTP Error caught: {e.code} {e.reason}")
     except Exception as e:
@@ -146,4 +231,5 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    # 引数でベースURLを指定できる（例: python sample_http_get.py http://127.0.0.1:8080）
+    main(*sys.argv[1:2])
\ No newline at end of file
@@ -0,0 +1,165 @@
+"""
+ヘッジリクエストでテールレイテンシを抑えるサンプルコード
+一定時間（直近のレイテンシのパーセンタイル）以内に応答がなければ同じリクエストをもう1本送り、
+先に返ってきた方を使ってもう一方は取り消す。
+失敗時の再試行の待ち時間には、sample_random.pyと同じくrandom.uniformでジッターを加える。
+"""
+
+import random
+import threading
+import time
+import urllib.error
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+from sample_http_get import get_json_api
+from sample_httpbin_server import serve_in_thread
+from sample_latency_stats import SlidingWindow, percentiles
+
+
+class HedgingPolicy:
+    """
+    ヘッジと再試行の方針
+
+    Args:
+        percentile: ヘッジを送るまでの待ち時間に使うレイテンシのパーセンタイル
+        window: パーセンタイルの計算に使う直近のサンプル数
+        min_samples: サンプルがこの件数に満たない間はinitial_delayを使う
+        initial_delay: サンプルが少ない間の待ち時間
+        min_delay: 待ち時間の下限
+        max_delay: 待ち時間の上限
+        max_retries: 接続エラー・5xxの再試行回数
+        backoff_base: 再試行までの待ち時間の基準（再試行のたびに2倍）
+        backoff_range: 待ち時間に加えるジッターの幅（基準±この秒数）
+        on_retry: 再試行の前に(試行回数, 待ち秒数, 例外)で呼び出される関数（ログ出力などに使う）
+    """
+
+    def __init__(self, percentile: float = 0.95, window: int = 1000, min_samples: int = 20,
+                 initial_delay: float = 0.1, min_delay: float = 0.005, max_delay: float = 1.0,
+                 max_retries: int = 2, backoff_base: float = 0.2, backoff_range: float = 0.1,
+                 max_workers: int = 32,
+                 on_retry: Optional[Callable[[int, float, BaseException], None]] = None):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_range = backoff_range
+        self.on_retry = on_retry
+        self.histogram = SlidingWindow(window)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedging')
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+
+    def count_hedge(self, won: bool = False) -> None:
+        """ヘッジの送信数・勝った数を数える（複数スレッドから呼ばれる）"""
+        with self._lock:
+            if won:
+                self.hedge_wins += 1
+            else:
+                self.hedges += 1
+
+    def hedge_delay(self) -> float:
+        delay = self.histogram.percentile(self.percentile * 100) if len(self.histogram) >= self.min_samples else None
+        if delay is None:
+            delay = self.initial_delay
+        return min(max(delay, self.min_delay), self.max_delay)
+
+    def backoff(self, attempt: int) -> float:
+        base_time = self.backoff_base * 2 ** attempt
+        base_range = min(self.backoff_range * 2 ** attempt, base_time)
+        return random.uniform(base_time - base_range, base_time + base_range)
+
+
+def _hedged_call(policy: HedgingPolicy, func: Callable[..., Any], *args) -> Any:
+    # 記録するのは呼び出し側が待った時間（最初に成功した応答までの時間）だけにする。
+    # 負けた方の遅い応答まで記録すると、待ち時間のパーセンタイルが削りたいテールそのものに引きずられる
+    start = time.perf_counter()
+    primary = policy.executor.submit(func, *args)
+    done, _ = wait([primary], timeout=policy.hedge_delay())
+    if done:
+        result = primary.result()
+        policy.histogram.record(time.perf_counter() - start)
+        return result
+
+    policy.count_hedge()
+    hedge = policy.executor.submit(func, *args)
+    pending = {primary, hedge}
+    errors: List[BaseException] = []
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                # 負けた方は取り消す（実行中のurlopenは止められないため、結果を捨てるだけになる）
+                for other in pending:
+                    other.cancel()
+                if future is hedge:
+                    policy.count_hedge(won=True)
+                policy.histogram.record(time.perf_counter() - start)
+                return future.result()
+            errors.append(future.exception())
+    raise errors[0]
+
+
+def hedged_get_json_api(url: str, params: Optional[Dict[str, str]] = None,
+                        policy: Optional[HedgingPolicy] = None) -> Dict[str, Any]:
+    """
+    ヘッジ付きのJSON APIへのGETリクエスト
+
+    Args:
+        url: APIのURL
+        params: クエリパラメータ
+        policy: ヘッジと再試行の方針（省略時はモジュール共通の方針）
+
+    Returns:
+        JSONレスポンス
+    """
+    policy = policy or _default_policy
+    for attempt in range(policy.max_retries + 1):
+        try:
+            return _hedged_call(policy, get_json_api, url, params)
+        except urllib.error.HTTPError as e:
+            # 4xxは再試行しても結果が変わらない
+            if e.code < 500 or attempt == policy.max_retries:
+                raise
+            error: BaseException = e
+        except urllib.error.URLError as e:
+            if attempt == policy.max_retries:
+                raise
+            error = e
+        wait_time = policy.backoff(attempt)
+        if policy.on_retry is not None:
+            policy.on_retry(attempt + 1, wait_time, error)
+        time.sleep(wait_time)
+    raise AssertionError('unreachable')
+
+
+_default_policy = HedgingPolicy()
+
+
+def main():
+    """メイン実行関数"""
+
+    print("=== ヘッジリクエストのサンプル ===")
+
+    # 5%のリクエストだけ300ms遅れるサーバーで、通常のリクエストとヘッジ付きリクエストを比較する
+    # どのリクエストが遅れるかを毎回同じにするため、サーバーの乱数のシードを固定する
+    with serve_in_thread(tail_ratio=0.05, tail_delay=0.3, seed=0) as base_url:
+        url = f'{base_url}/get'
+        for name, func in (('get_json_api', get_json_api), ('hedged_get_json_api', hedged_get_json_api)):
+            latencies = []
+            for _ in range(300):
+                start = time.perf_counter()
+                func(url)
+                latencies.append(time.perf_counter() - start)
+            print(f"{name}: " + ', '.join(f'{p}={seconds * 1000:.1f}ms'
+                                          for p, seconds in percentiles(latencies).items()))
+        print(f"hedge delay={_default_policy.hedge_delay() * 1000:.1f}ms, "
+              f"hedges={_default_policy.hedges}, hedge wins={_default_policy.hedge_wins}")
+
+
+if __name__ == '__main__':
+    main()
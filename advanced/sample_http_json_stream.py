@@ -0,0 +1,197 @@
+"""
+大きなJSONレスポンスを逐次デコードするサンプルコード
+get_json_apiはレスポンス全体をbytes・str・オブジェクトとして3重にメモリに持つため、
+受信した分から少しずつデコードし、トップレベル（または指定したパス）の配列の要素を1つずつ返す。
+"""
+
+import codecs
+import io
+import json
+import tracemalloc
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import IO, Any, Dict, Iterator, List, Optional, Sequence, Union
+
+_WHITESPACE = ' \t\n\r'
+_NUMBER_CHARS = '0123456789.eE+-'
+
+
+class _JsonStreamReader:
+    """バイトストリームを少しずつ読みながら、JSONの値を1つずつ取り出す"""
+
+    def __init__(self, fp: IO[bytes], chunk_size: int = 64 * 1024):
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json_decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, min_chars: int = 0) -> None:
+        """読み終わった部分を捨て、未処理の部分がmin_chars文字以上になるまで（最低1チャンク）読み足す"""
+        parts = [self._buffer[self._pos:]]
+        size = len(parts[0])
+        while True:
+            chunk = self._fp.read(self._chunk_size)
+            text = self._decoder.decode(chunk, final=not chunk)
+            parts.append(text)
+            size += len(text)
+            if not chunk:
+                self._eof = True
+                break
+            if size >= min_chars:
+                break
+        # バッファのコピーは読み足しごとに1回だけにする
+        self._buffer = ''.join(parts)
+        self._pos = 0
+
+    def _peek(self) -> str:
+        """空白を読み飛ばして次の1文字を返す（終端なら空文字）"""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer) or self._eof:
+                return self._buffer[self._pos:self._pos + 1]
+            self._fill()
+
+    def expect(self, char: str) -> None:
+        found = self._peek()
+        if found != char:
+            raise json.JSONDecodeError(f'Expecting {char!r}, found {found!r}', self._buffer, self._pos)
+        self._pos += 1
+
+    def consume_if(self, char: str) -> bool:
+        if self._peek() == char:
+            self._pos += 1
+            return True
+        return False
+
+    def value(self) -> Any:
+        """
+        次の値を1つデコードする。値が途中までしか届いていなければ、続きを読んでからやり直す
+        やり直すたびに値の先頭からデコードし直すため、未処理の部分が倍になるまで読み足して、
+        大きな値でもデコードのやり直しにかかる時間が値の大きさに比例する程度に抑える。
+        """
+        self._peek()
+        while True:
+            try:
+                obj, end = self._json_decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+                self._fill(2 * (len(self._buffer) - self._pos))
+                continue
+            # 数値は途中（"12"や"12."）で切れていてもデコードに成功してしまうため、続きがあるなら読み直す
+            if (not self._eof and isinstance(obj, (int, float)) and not isinstance(obj, bool)
+                    and (end == len(self._buffer) or self._buffer[end] in _NUMBER_CHARS)):
+                self._fill(2 * (len(self._buffer) - self._pos))
+                continue
+            self._pos = end
+            return obj
+
+
+def iter_json_items(fp: IO[bytes], path: Union[str, Sequence[str], None] = None,
+                    chunk_size: int = 64 * 1024) -> Iterator[Any]:
+    """
+    JSONドキュメント内の配列の要素を、先頭から1つずつ返す
+
+    Args:
+        fp: JSONを読み込むバイナリストリーム
+        path: 配列までのオブジェクトのキー（'data.items'または['data', 'items']）。省略時はトップレベルの配列
+        chunk_size: 1回に読み込むバイト数
+
+    指定したパス以外のキーの値は、読み飛ばすために一度デコードする。
+    """
+    keys: List[str] = path.split('.') if isinstance(path, str) else list(path or [])
+    reader = _JsonStreamReader(fp, chunk_size)
+
+    for key in keys:
+        reader.expect('{')
+        while True:
+            if reader.consume_if('}'):
+                raise KeyError(key)
+            name = reader.value()
+            reader.expect(':')
+            if name == key:
+                break
+            reader.value()
+            reader.consume_if(',')
+
+    reader.expect('[')
+    if reader.consume_if(']'):
+        return
+    while True:
+        yield reader.value()
+        if reader.consume_if(']'):
+            return
+        reader.expect(',')
+
+
+def iter_json_api(url: str, params: Optional[Dict[str, str]] = None,
+                  path: Union[str, Sequence[str], None] = None) -> Iterator[Any]:
+    """
+    JSON APIへのGETリクエスト（ストリーミング版）
+
+    Args:
+        url: APIのURL
+        params: クエリパラメータ
+        path: 要素を取り出す配列までのキー。省略時はトップレベルの配列
+
+    Returns:
+        配列の要素のイテレータ
+    """
+    if params:
+        query_string = urllib.parse.urlencode(params)
+        url = f"{url}?{query_string}"
+
+    headers = {
+        'User-Agent': 'Python urllib sample',
+        'Accept': 'application/json'
+    }
+
+    request = urllib.request.Request(url, headers=headers)
+
+    try:
+        with urllib.request.urlopen(request) as response:
+            yield from iter_json_items(response, path)
+    except urllib.error.HTTPError as e:
+        print(f"HTTP Error: {e.code} {e.reason}")
+        raise
+    except urllib.error.URLError as e:
+        print(f"URL Error: {e.reason}")
+        raise
+    except json.JSONDecodeError as e:
+        print(f"JSON Decode Error: {e}")
+        raise
+
+
+def main():
+    """メイン実行関数"""
+
+    print("=== JSONの逐次デコードのサンプル ===")
+
+    document = json.dumps({
+        'count': 200_000,
+        'data': {'items': [{'id': i, 'name': f'item-{i}', 'score': i / 3} for i in range(200_000)]},
+    }).encode('utf-8')
+    print(f"Document size: {len(document) / 2 ** 20:.1f} MiB")
+
+    tracemalloc.start()
+    total = 0
+    for item in iter_json_items(io.BytesIO(document), 'data.items'):
+        total += item['id']
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"iter_json_items: sum={total}, peak={peak / 2 ** 20:.1f} MiB")
+
+    tracemalloc.start()
+    total = sum(item['id'] for item in json.loads(document.decode('utf-8'))['data']['items'])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"json.loads     : sum={total}, peak={peak / 2 ** 20:.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+HTTPヘルパーの負荷試験用CLI
+sample_http_get.py（または--pooledでsample_http_pool.py）のヘルパーを目標RPSで呼び出し、
+スループットとレイテンシのパーセンタイルを表示する。
+--urlを省略すると、httpbin互換のローカルサーバーを起動してそこに負荷をかける。
+
+実行例:
+    python sample_http_load.py --helper json --rps 200 --duration 10
+    python sample_http_load.py --url http://127.0.0.1:8080 --path /delay/0.1 --rps 100 --workers 64
+"""
+
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Optional
+
+import sample_http_get
+import sample_http_pool
+from sample_httpbin_server import serve_in_thread
+from sample_latency_stats import percentiles
+
+
+def _helper(name: str, pooled: bool) -> Callable[[str], Any]:
+    module: Any = sample_http_pool if pooled else sample_http_get
+    if name == 'simple':
+        return module.simple_get_request
+    if name == 'headers':
+        return lambda url: module.get_request_with_headers(url, {'Accept': 'application/json'})
+    return module.get_json_api
+
+
+def run_load(url: str, func: Callable[[str], Any], rps: float, duration: float, workers: int) -> Dict[str, Any]:
+    """
+    目標RPSでリクエストを送り続け、結果を集計する
+    レイテンシは「送るはずだった時刻」から計測するため、ワーカーが詰まって送信が遅れた分も含まれる。
+    """
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def call(scheduled: float) -> None:
+        try:
+            func(url)
+        except Exception as e:
+            with lock:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            return
+        with lock:
+            latencies.append(time.perf_counter() - scheduled)
+
+    total = int(rps * duration)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for i in range(total):
+            # 前のリクエストの完了を待たずに、一定間隔で送り出す（オープンループ）
+            scheduled = start + i / rps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(call, scheduled)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': total,
+        'succeeded': len(latencies),
+        'errors': errors,
+        'elapsed': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'latency_ms': {p: seconds * 1000 for p, seconds in percentiles(latencies, (50, 90, 95, 99)).items()} |
+        {'max': latencies[-1] * 1000 if latencies else 0.0},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='HTTPヘルパーの負荷試験')
+    parser.add_argument('--url', help='ベースURL（省略時はローカルサーバーを起動する）')
+    parser.add_argument('--path', default='/get')
+    parser.add_argument('--helper', choices=('simple', 'headers', 'json'), default='json')
+    parser.add_argument('--pooled', action='store_true', help='コネクションプール版のヘルパーを使う')
+    parser.add_argument('--rps', type=float, default=100.0)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--json', action='store_true', help='結果をJSONで出力する')
+    args = parser.parse_args(argv)
+
+    with (nullcontext(args.url) if args.url else serve_in_thread()) as base_url:
+        result = run_load(base_url + args.path, _helper(args.helper, args.pooled), args.rps, args.duration,
+                          args.workers)
+
+    if args.json:
+        print(json.dumps(result, indent=4))
+        return
+    print(f"requests: {result['requests']}, succeeded: {result['succeeded']}, errors: {result['errors']}")
+    print(f"throughput: {result['throughput']:.1f} req/s (target {args.rps:.1f})")
+    print('latency: ' + ', '.join(f'{name}={value:.2f}ms' for name, value in result['latency_ms'].items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""
+コネクションプールを使ったHTTP GETリクエストのサンプルコード
+urllib.request.urlopenはリクエストごとにTCP（TLS）接続を張り直すため、
+http.clientの接続をホストごとにkeep-aliveで使い回す。
+"""
+
+import http.client
+import io
+import json
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import deque
+from typing import Any, Deque, Dict, NamedTuple, Optional, Tuple
+
+from sample_httpbin_server import serve_in_thread
+
+_REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+class PooledResponse(NamedTuple):
+    url: str
+    status_code: int
+    reason: str
+    headers: http.client.HTTPMessage
+    body: bytes
+
+
+class HTTPConnectionPool:
+    """
+    ホストごとにkeep-aliveの接続を保持するプール
+    スレッドセーフで、同じホストへの同時リクエストにはそれぞれ別の接続を使う。
+    max_sizeは保持するアイドル接続の数だけを制限し、同時に使う接続の数は制限しない（同時実行数は呼び出し側で抑える）。
+    """
+
+    def __init__(self, max_size: int = 10, idle_timeout: float = 30.0, timeout: float = 10.0):
+        """
+        Args:
+            max_size: ホストごとに保持するアイドル接続の最大数（超えた分は使い終わったら閉じる）
+            idle_timeout: この秒数以上使われていない接続は、どのホストの接続でも次のリクエスト時に閉じる
+            timeout: 接続・読み込みのタイムアウト秒数
+        """
+        self._max_size = max_size
+        self._idle_timeout = idle_timeout
+        self._timeout = timeout
+        self._idle: Dict[Tuple[str, str, Optional[int]], Deque[Tuple[http.client.HTTPConnection, float]]] = {}
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+        self._closed = False
+
+    def _evict_expired(self, now: float) -> None:
+        """全ホストのアイドル接続から期限切れのものを閉じる。ロックを取った状態で呼ぶ"""
+        # 毎回全ホストを見ると重いため、idle_timeoutの1/10（最大1秒）に1回だけ見る
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + min(self._idle_timeout / 10, 1.0)
+        for key in list(self._idle):
+            idle = self._idle[key]
+            # 古い接続は左側に溜まるため、期限切れのものを左から閉じていく
+            while idle and now - idle[0][1] > self._idle_timeout:
+                idle.popleft()[0].close()
+            if not idle:
+                del self._idle[key]
+
+    def _acquire(self, key: Tuple[str, str, Optional[int]]) -> Tuple[http.client.HTTPConnection, bool]:
+        """接続を取り出す。再利用した接続ならTrueも返す"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            idle = self._idle.get(key)
+            # 直近のスイープ後に期限切れになった接続は使わない
+            while idle and now - idle[0][1] > self._idle_timeout:
+                idle.popleft()[0].close()
+            if idle:
+                return idle.pop()[0], True
+        scheme, host, port = key
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return connection_class(host, port, timeout=self._timeout), False
+
+    def _release(self, key: Tuple[str, str, Optional[int]], connection: http.client.HTTPConnection) -> None:
+        with self._lock:
+            # close()の後に終わったリクエストの接続は、プールに戻さずに閉じる
+            idle = None if self._closed else self._idle.setdefault(key, deque())
+            if idle is not None and len(idle) < self._max_size:
+                idle.append((connection, time.monotonic()))
+                return
+        connection.close()
+
+    def request(self, method: str, url: str, headers: Optional[Dict[str, str]] = None,
+                max_redirects: int = 10) -> PooledResponse:
+        """
+        リクエストを送ってレスポンスを読み切る
+        urlopenと同じく、リダイレクトに従い、4xx・5xxはurllib.error.HTTPErrorを送出する。
+        """
+        headers = headers or {}
+        for _ in range(max_redirects + 1):
+            response = self._request_once(method, url, headers)
+            location = response.headers.get('Location')
+            if response.status_code not in _REDIRECT_CODES or location is None:
+                break
+            url = urllib.parse.urljoin(url, location)
+            if response.status_code == 303:
+                method = 'GET'
+
+        if response.status_code >= 400:
+            raise urllib.error.HTTPError(response.url, response.status_code, response.reason,
+                                         response.headers, io.BytesIO(response.body))
+        return response
+
+    def _request_once(self, method: str, url: str, headers: Dict[str, str]) -> PooledResponse:
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname or '', parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path = f'{path}?{parts.query}'
+
+        while True:
+            connection, reused = self._acquire(key)
+            try:
+                connection.request(method, path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                # サーバー側で閉じられていたアイドル接続なら、新しい接続でやり直す
+                if reused and isinstance(e, (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)):
+                    continue
+                # urlopenと同じく、接続・通信のエラーはURLErrorにして送出する
+                raise urllib.error.URLError(e) from e
+            except BaseException:
+                connection.close()
+                raise
+            break
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(key, connection)
+        return PooledResponse(url, response.status, response.reason, response.msg, body)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            for idle in self._idle.values():
+                while idle:
+                    idle.pop()[0].close()
+            self._idle.clear()
+
+    def __enter__(self) -> 'HTTPConnectionPool':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+_default_pool = HTTPConnectionPool()
+
+
+def simple_get_request(url: str, pool: Optional[HTTPConnectionPool] = None) -> str:
+    """
+    シンプルなGETリクエスト
+
+    Args:
+        url: リクエスト先のURL
+        pool: 使用するコネクションプール（省略時はモジュール共通のプール）
+
+    Returns:
+        レスポンステキスト
+    """
+    return (pool or _default_pool).request('GET', url).body.decode('utf-8')
+
+
+def get_request_with_headers(url: str, headers: Dict[str, str],
+                             pool: Optional[HTTPConnectionPool] = None) -> Dict[str, Any]:
+    """
+    ヘッダー付きGETリクエスト
+
+    Args:
+        url: リクエスト先のURL
+        headers: HTTPヘッダー
+        pool: 使用するコネクションプール（省略時はモジュール共通のプール）
+
+    Returns:
+        レスポンス情報の辞書
+    """
+    response = (pool or _default_pool).request('GET', url, headers)
+    return {
+        'status_code': response.status_code,
+        'headers': dict(response.headers),
+        'content': response.body.decode('utf-8')
+    }
+
+
+def get_json_api(url: str, params: Optional[Dict[str, str]] = None,
+                 pool: Optional[HTTPConnectionPool] = None) -> Dict[str, Any]:
+    """
+    JSON APIへのGETリクエスト
+
+    Args:
+        url: APIのURL
+        params: クエリパラメータ
+        pool: 使用するコネクションプール（省略時はモジュール共通のプール）
+
+    Returns:
+        JSONレスポンス
+    """
+    if params:
+        query_string = urllib.parse.urlencode(params)
+        url = f"{url}?{query_string}"
+
+    headers = {
+        'User-Agent': 'Python urllib sample',
+        'Accept': 'application/json'
+    }
+
+    try:
+        response = (pool or _default_pool).request('GET', url, headers)
+        return json.loads(response.body.decode('utf-8'))
+    except urllib.error.HTTPError as e:
+        print(f"HTTP Error: {e.code} {e.reason}")
+        raise
+    except urllib.error.URLError as e:
+        print(f"URL Error: {e.reason}")
+        raise
+    except json.JSONDecodeError as e:
+        print(f"JSON Decode Error: {e}")
+        raise
+
+
+def benchmark(requests: int = 1000) -> None:
+    """ローカルサーバーに対して、urlopenとコネクションプールの処理時間を比較する"""
+    with serve_in_thread() as base_url:
+        url = f'{base_url}/get'
+
+        start = time.perf_counter()
+        for _ in range(requests):
+            with urllib.request.urlopen(url) as response:
+                response.read()
+        urlopen_elapsed = time.perf_counter() - start
+
+        with HTTPConnectionPool() as pool:
+            start = time.perf_counter()
+            for _ in range(requests):
+                simple_get_request(url, pool)
+            pool_elapsed = time.perf_counter() - start
+
+    print(f'urlopen: {urlopen_elapsed:.3f} sec ({requests / urlopen_elapsed:.0f} req/s)')
+    print(f'pool   : {pool_elapsed:.3f} sec ({requests / pool_elapsed:.0f} req/s)')
+
+
+def main():
+    """メイン実行関数"""
+
+    print("=== コネクションプールを使ったHTTP GETリクエストサンプル ===")
+
+    with serve_in_thread() as base_url:
+        print("1. JSON APIリクエスト（パラメータ付き）")
+        response = get_json_api(f'{base_url}/get', {'param1': 'value1'})
+        print(f"URL: {response['url']}")
+        print(f"Args: {response['args']}")
+
+        print("2. エラーハンドリングの例（404）")
+        try:
+            simple_get_request(f'{base_url}/status/404')
+        except urllib.error.HTTPError as e:
+            print(f"HTTP Error caught: {e.code} {e.reason}")
+
+    print("3. ベンチマーク")
+    benchmark()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+同じURLへの同時リクエストを1つにまとめる（single-flight）サンプルコード
+あるキーのリクエストが実行中の間に来た同じキーの呼び出しは、新たにリクエストせず、
+最初の呼び出しの結果（または例外）を共有する。スレッドとasyncioのタスクの両方に対応する。
+"""
+
+import asyncio
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from sample_http_get import get_json_api, simple_get_request
+from sample_httpbin_server import serve_in_thread
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.exception: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """スレッド用のsingle-flight"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.coalesced = 0
+
+    def do(self, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        keyごとに1回だけfuncを実行し、実行中に来た呼び出しには同じ結果を返す
+        結果のオブジェクトは全ての呼び出し元で共有されるため、書き換えないこと。
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.event.wait()
+            if call.exception is not None:
+                raise call.exception
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.exception = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+
+class AsyncSingleFlight:
+    """asyncio用のsingle-flight"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            # 最初の呼び出し元がキャンセルされても、待っている他の呼び出し元の処理は続ける
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
+
+
+_single_flight = SingleFlight()
+_async_single_flight = AsyncSingleFlight()
+
+
+def _json_api_key(url: str, params: Optional[Dict[str, str]]) -> str:
+    return f'{url}?{urllib.parse.urlencode(params)}' if params else url
+
+
+def coalesced_simple_get_request(url: str) -> str:
+    return _single_flight.do(('simple_get_request', url), simple_get_request, url)
+
+
+def coalesced_get_json_api(url: str, params: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    return _single_flight.do(('get_json_api', _json_api_key(url, params)), get_json_api, url, params)
+
+
+async def coalesced_simple_get_request_async(url: str) -> str:
+    return await _async_single_flight.do(('simple_get_request', url), asyncio.to_thread, simple_get_request, url)
+
+
+async def coalesced_get_json_api_async(url: str, params: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    key = ('get_json_api', _json_api_key(url, params))
+    return await _async_single_flight.do(key, asyncio.to_thread, get_json_api, url, params)
+
+
+def main():
+    """メイン実行関数"""
+
+    print("=== single-flightのサンプル ===")
+
+    with serve_in_thread() as base_url:
+        url = f'{base_url}/delay/0.5'
+
+        print("1. スレッドから同時に20回呼び出す")
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            results = list(executor.map(lambda _: coalesced_get_json_api(url, {'id': '1'}), range(20)))
+        print(f"{len(results)} results, {time.perf_counter() - start:.3f} sec, coalesced={_single_flight.coalesced}")
+
+        print("2. asyncioのタスクから同時に20回呼び出す")
+
+        async def fetch_all():
+            return await asyncio.gather(*(coalesced_simple_get_request_async(url) for _ in range(20)))
+
+        start = time.perf_counter()
+        results = asyncio.run(fetch_all())
+        print(f"{len(results)} results, {time.perf_counter() - start:.3f} sec, "
+              f"coalesced={_async_single_flight.coalesced}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+"""
+HTTPリクエストのフェーズごとの所要時間を計測するサンプルコード
+urllib.requestのハンドラーを差し替えて、DNS解決・TCP接続・TLSハンドシェイク・
+最初のバイトまで（TTFB）・本文の転送の時間を記録し、ホストごとのヒストグラムに集計する。
+集計結果はdict、またはPrometheusのテキスト形式で出力できる。
+"""
+
+import http.client
+import socket
+import threading
+import time
+import urllib.parse
+import urllib.request
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sample_http_get import get_request_with_headers
+from sample_httpbin_server import serve_in_thread
+from sample_latency_stats import BucketHistogram
+
+PHASES = ('dns', 'connect', 'tls', 'ttfb', 'transfer', 'total')
+
+# ヒストグラムのバケットの上限（秒）。最後に+Infのバケットがある
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 実行中のリクエストの計測結果。urllibが内部で生成する接続オブジェクトから参照する
+_current = threading.local()
+
+
+class _TimedConnectionMixin:
+    """接続の生成とリクエストの送受信にかかった時間を記録する"""
+
+    def _init_timing(self) -> None:
+        self.phases: Dict[str, float] = getattr(_current, 'phases', {})
+        # http.clientはsocket.create_connectionで名前解決と接続をまとめて行うため、2段階に分けて計測する
+        self._create_connection = self._timed_create_connection
+
+    def _add_phase(self, phase: str, seconds: float) -> None:
+        # リダイレクトでは同じリクエストの中で接続が作り直されるため、上書きせずに合算する
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def _timed_create_connection(self, address: Tuple[str, int], timeout: Any = socket._GLOBAL_DEFAULT_TIMEOUT,
+                                 source_address: Optional[Tuple[str, int]] = None) -> socket.socket:
+        host, port = address
+        start = time.perf_counter()
+        infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        resolved = time.perf_counter()
+        self._add_phase('dns', resolved - start)
+
+        error: Optional[OSError] = None
+        for family, sock_type, proto, _, sockaddr in infos:
+            sock = socket.socket(family, sock_type, proto)
+            try:
+                if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                    sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(sockaddr)
+                self._add_phase('connect', time.perf_counter() - resolved)
+                return sock
+            except OSError as e:
+                sock.close()
+                error = e
+        raise error or OSError(f'getaddrinfo returned no address for {host}')
+
+    def request(self, *args, **kwargs) -> None:
+        super().request(*args, **kwargs)  # type: ignore[misc]
+        self._request_sent = time.perf_counter()
+
+    def getresponse(self) -> http.client.HTTPResponse:
+        response = super().getresponse()  # type: ignore[misc]
+        self._add_phase('ttfb', time.perf_counter() - self._request_sent)
+        return response
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._init_timing()
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._init_timing()
+
+    def connect(self) -> None:
+        before = self.phases.get('dns', 0.0) + self.phases.get('connect', 0.0)
+        start = time.perf_counter()
+        super().connect()
+        # 接続全体からこの接続でのDNS解決とTCP接続を引いた残りが、TLSハンドシェイクの時間になる
+        elapsed = time.perf_counter() - start
+        tcp = self.phases.get('dns', 0.0) + self.phases.get('connect', 0.0) - before
+        self._add_phase('tls', max(elapsed - tcp, 0.0))
+
+
+class TimedHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(TimedHTTPConnection, req)
+
+
+class TimedHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(TimedHTTPSConnection, req, context=self._context)
+
+
+class PhaseRecorder:
+    """フェーズごとの所要時間を、ホスト単位のヒストグラムに集計する"""
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, str], BucketHistogram] = {}
+        self._hooks: List[Callable[[str, Dict[str, float]], None]] = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook: Callable[[str, Dict[str, float]], None]) -> None:
+        """リクエストごとに(host, phases)で呼び出される関数を登録する"""
+        self._hooks.append(hook)
+
+    def record(self, host: str, phases: Dict[str, float]) -> None:
+        with self._lock:
+            for phase, seconds in phases.items():
+                histogram = self._histograms.get((host, phase))
+                if histogram is None:
+                    histogram = self._histograms[(host, phase)] = BucketHistogram(BUCKETS)
+                histogram.observe(seconds)
+        for hook in self._hooks:
+            hook(host, phases)
+
+    def to_dict(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """{host: {phase: {count, sum, buckets}}}の形式で出力する（bucketsは上限ごとの累積件数）"""
+        result: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        with self._lock:
+            for (host, phase), histogram in sorted(self._histograms.items()):
+                result.setdefault(host, {})[phase] = {
+                    'count': histogram.count,
+                    'sum': histogram.total,
+                    'buckets': {str(upper): count for upper, count in histogram.cumulative()},
+                }
+        return result
+
+    def to_prometheus(self, name: str = 'http_client_phase_seconds') -> str:
+        """Prometheusのテキスト形式で出力する"""
+        lines = [f'# HELP {name} Time spent in each phase of an HTTP request.', f'# TYPE {name} histogram']
+        for host, phases in self.to_dict().items():
+            for phase, histogram in phases.items():
+                labels = f'host="{host}",phase="{phase}"'
+                for upper, count in histogram['buckets'].items():
+                    le = '+Inf' if upper == 'inf' else upper
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+                lines.append(f'{name}_sum{{{labels}}} {histogram["sum"]}')
+                lines.append(f'{name}_count{{{labels}}} {histogram["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+class TimedOpener:
+    """
+    フェーズごとの計測付きでリクエストを送るopener
+    sample_http_get.get_request_with_headersのopenerに渡して使う。
+    レスポンスを閉じた時点で計測を終え、集計先に記録する。
+    """
+
+    def __init__(self, recorder: Optional[PhaseRecorder] = None):
+        self._opener = urllib.request.build_opener(TimedHTTPHandler, TimedHTTPSHandler)
+        self._recorder = recorder
+
+    def open(self, request: urllib.request.Request, *args, **kwargs) -> http.client.HTTPResponse:
+        phases: Dict[str, float] = {}
+        _current.phases = phases
+        start = time.perf_counter()
+        try:
+            response = self._opener.open(request, *args, **kwargs)
+        except BaseException:
+            # 失敗したリクエストも、到達したフェーズまでは記録する
+            self._finish(request, phases, start)
+            raise
+        finally:
+            _current.phases = {}
+
+        body_start = time.perf_counter()
+        close = response.close
+
+        def timed_close() -> None:
+            if 'total' not in phases:
+                phases['transfer'] = time.perf_counter() - body_start
+                self._finish(request, phases, start)
+            close()
+
+        response.close = timed_close  # type: ignore[method-assign]
+        return response
+
+    def _finish(self, request: urllib.request.Request, phases: Dict[str, float], start: float) -> None:
+        phases['total'] = time.perf_counter() - start
+        _current.last_phases = phases
+        (self._recorder or default_recorder).record(urllib.parse.urlsplit(request.full_url).netloc, phases)
+
+
+default_recorder = PhaseRecorder()
+_opener = TimedOpener()
+
+
+def timed_get_request_with_headers(url: str, headers: Dict[str, str],
+                                   recorder: Optional[PhaseRecorder] = None, **kwargs) -> Dict[str, Any]:
+    """
+    ヘッダー付きGETリクエスト（フェーズごとの計測付き）
+
+    Args:
+        url: リクエスト先のURL
+        headers: HTTPヘッダー
+        recorder: 計測結果の集計先（省略時はモジュール共通の集計先）
+        **kwargs: get_request_with_headersにそのまま渡す引数（compressed、body_format）
+
+    Returns:
+        レスポンス情報の辞書。'timings'にフェーズごとの秒数が入る
+    """
+    opener = _opener if recorder is None else TimedOpener(recorder)
+    result = get_request_with_headers(url, headers, opener=opener, **kwargs)
+    result['timings'] = _current.last_phases
+    return result
+
+
+def main():
+    """メイン実行関数"""
+
+    print("=== フェーズごとの計測のサンプル ===")
+
+    with serve_in_thread() as base_url:
+        for _ in range(100):
+            response = timed_get_request_with_headers(f'{base_url}/get', {'Accept': 'application/json'})
+        print(f"Timings: {response['timings']}")
+
+        # 計測自体のオーバーヘッドを、計測なしのurlopenと交互に実行して比較する
+        timed = plain = 0.0
+        for _ in range(1000):
+            start = time.perf_counter()
+            timed_get_request_with_headers(f'{base_url}/get', {})
+            timed += time.perf_counter() - start
+            start = time.perf_counter()
+            with urllib.request.urlopen(f'{base_url}/get') as response:
+                response.read()
+            plain += time.perf_counter() - start
+        print(f"timed: {timed:.3f} sec, plain: {plain:.3f} sec, "
+              f"overhead: {(timed - plain) / 1000 * 1_000_000:.1f} usec/request")
+
+    print(default_recorder.to_prometheus()[:800])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""
+httpbin.org互換のローカルサーバー（asyncio版）
+CIや検証環境からhttpbin.orgに接続できないため、/get・/headers・/status/<code>・/etag/<etag>・/bytes/<n>・/delay/<s>
+（と/gzip・/deflate）をasyncio.start_serverで実装する。/delayは待機中もイベントループを止めないため、遅いレスポンスを大量に並行して返せる。
+/bytes/<n>はHEADとRangeリクエストにも対応し、同じnと?seedなら毎回同じ内容を返す。
+tail_ratio・tail_delayを指定すると、一部のリクエストだけを遅らせて上流のテールレイテンシを再現する。
+
+実行例:
+    python sample_httpbin_server.py --port 8080
+    python sample_httpbin_server.py --port 8080 --tail-ratio 0.05 --tail-delay 0.3
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import random
+import re
+import threading
+import urllib.parse
+import zlib
+from contextlib import contextmanager
+from http import HTTPStatus
+from typing import Dict, Iterator, Optional, Tuple
+
+MAX_DELAY = 10.0
+MAX_BYTES = 100 * 1024 * 1024
+
+
+def _json_body(body: dict) -> Tuple[bytes, Dict[str, str]]:
+    return json.dumps(body, indent=2).encode('utf-8'), {'Content-Type': 'application/json'}
+
+
+@functools.lru_cache(maxsize=8)
+def _payload(size: int, seed: int) -> bytes:
+    return random.Random(seed).randbytes(size)
+
+
+def _bytes_response(size: int, seed: int, range_header: str) -> Tuple[int, Dict[str, str], bytes]:
+    content = _payload(size, seed)
+    headers = {'Content-Type': 'application/octet-stream', 'Accept-Ranges': 'bytes', 'ETag': f'"{size}-{seed}"'}
+    match = re.fullmatch(r'bytes=(\d+)-(\d*)', range_header)
+    if match is None:
+        return 200, headers, content
+    start = int(match.group(1))
+    end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    if start > end:
+        return 416, {'Content-Range': f'bytes */{size}'}, b''
+    headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return 206, headers, content[start:end + 1]
+
+
+def handle_request(method: str, target: str, headers: Dict[str, str], host: str) -> Tuple[int, Dict[str, str], bytes]:
+    """
+    リクエストに対するレスポンスを作る（/delayの待機は呼び出し側で行う）
+
+    Returns:
+        ステータスコード、ヘッダー、本文
+    """
+    url = urllib.parse.urlsplit(target)
+    parts = url.path.strip('/').split('/')
+    request_info = {
+        'args': dict(urllib.parse.parse_qsl(url.query)),
+        'headers': headers,
+        'origin': host,
+        'url': f'http://{headers.get("Host", "localhost")}{target}',
+    }
+
+    if url.path in ('/get', '/headers') and method in ('GET', 'HEAD'):
+        body, content_headers = _json_body(request_info if url.path == '/get' else {'headers': headers})
+        return 200, content_headers, body
+    if parts[0] == 'delay' and len(parts) == 2:
+        body, content_headers = _json_body(request_info)
+        return 200, content_headers, body
+    if url.path in ('/gzip', '/deflate'):
+        body, content_headers = _json_body({'gzipped' if parts[0] == 'gzip' else 'deflated': True, **request_info})
+        compressor = zlib.compressobj(wbits=31 if parts[0] == 'gzip' else 15)
+        return 200, {**content_headers, 'Content-Encoding': parts[0]}, compressor.compress(body) + compressor.flush()
+    if parts[0] == 'status' and len(parts) == 2 and parts[1].isdigit():
+        return int(parts[1]), {}, b''
+    if parts[0] == 'etag' and len(parts) == 2:
+        etag = f'"{parts[1]}"'
+        if etag in headers.get('If-None-Match', ''):
+            return 304, {'ETag': etag}, b''
+        body, content_headers = _json_body(request_info)
+        return 200, {**content_headers, 'ETag': etag}, body
+    if parts[0] == 'bytes' and len(parts) == 2 and parts[1].isdigit():
+        size = min(int(parts[1]), MAX_BYTES)
+        # ?seedを省略した場合はサイズをシードにして、分割ダウンロードでも同じ内容が返るようにする
+        seed = int(request_info['args'].get('seed', size))
+        return _bytes_response(size, seed, headers.get('Range', ''))
+    return 404, {}, b''
+
+
+class _TailLatency:
+    """一部のリクエストだけを遅らせる。seedを指定すると、どのリクエストが遅れるかが毎回同じになる"""
+
+    def __init__(self, ratio: float = 0.0, delay: float = 0.0, seed: Optional[int] = None):
+        self.ratio = ratio
+        self.delay = delay
+        self._random = random.Random(seed)
+
+    async def maybe_delay(self) -> None:
+        if self.ratio > 0 and self._random.random() < self.ratio:
+            await asyncio.sleep(self.delay)
+
+
+async def _handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                             tail: Optional[_TailLatency] = None) -> None:
+    peer = writer.get_extra_info('peername')
+    host = peer[0] if peer else ''
+    try:
+        # HTTP/1.1のkeep-aliveに対応し、1つの接続で続けてリクエストを処理する
+        while True:
+            try:
+                head = await reader.readuntil(b'\r\n\r\n')
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                return
+            request_line, *header_lines = head.decode('latin-1').split('\r\n')
+            method, target, version = request_line.split(' ', 2)
+            headers: Dict[str, str] = {}
+            for line in header_lines:
+                if ':' in line:
+                    name, value = line.split(':', 1)
+                    headers[name.strip().title()] = value.strip()
+            if headers.get('Content-Length'):
+                await reader.readexactly(int(headers['Content-Length']))
+
+            if tail is not None:
+                await tail.maybe_delay()
+            path = urllib.parse.urlsplit(target).path
+            if path.startswith('/delay/'):
+                try:
+                    await asyncio.sleep(min(float(path.rsplit('/', 1)[1]), MAX_DELAY))
+                except ValueError:
+                    pass
+
+            status, response_headers, body = handle_request(method, target, headers, host)
+            keep_alive = (version == 'HTTP/1.1' and headers.get('Connection', '').lower() != 'close') or \
+                headers.get('Connection', '').lower() == 'keep-alive'
+            reason = HTTPStatus(status).phrase if status in HTTPStatus._value2member_map_ else ''
+            lines = [f'HTTP/1.1 {status} {reason}']
+            lines += [f'{name}: {value}' for name, value in response_headers.items()]
+            lines += [f'Content-Length: {len(body)}', f'Connection: {"keep-alive" if keep_alive else "close"}']
+            writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+            if method != 'HEAD':
+                writer.write(body)
+            await writer.drain()
+            if not keep_alive:
+                return
+    except asyncio.CancelledError:
+        # サーバー停止時に、次のリクエストや/delay・テールの遅延を待っている接続は静かに閉じる
+        return
+    finally:
+        writer.close()
+
+
+async def serve(host: str = '127.0.0.1', port: int = 8080, tail_ratio: float = 0.0, tail_delay: float = 0.0,
+                seed: Optional[int] = None) -> None:
+    handler = functools.partial(_handle_connection, tail=_TailLatency(tail_ratio, tail_delay, seed))
+    server = await asyncio.start_server(handler, host, port)
+    print(f'Serving on http://{host}:{port}')
+    async with server:
+        await server.serve_forever()
+
+
+@contextmanager
+def serve_in_thread(host: str = '127.0.0.1', port: int = 0, tail_ratio: float = 0.0, tail_delay: float = 0.0,
+                    seed: Optional[int] = None) -> Iterator[str]:
+    """
+    別スレッドのイベントループでサーバーを起動し、ベースURLを返す
+
+    Args:
+        host: 待ち受けるアドレス
+        port: 待ち受けるポート。0なら空いているポートを使う
+        tail_ratio: 応答を遅らせるリクエストの割合（0〜1）
+        tail_delay: 遅らせる秒数
+        seed: どのリクエストを遅らせるかを決める乱数のシード
+    """
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    holder: Dict[str, asyncio.base_events.Server] = {}
+    errors: Dict[str, BaseException] = {}
+    handler = functools.partial(_handle_connection, tail=_TailLatency(tail_ratio, tail_delay, seed))
+
+    def run() -> None:
+        asyncio.set_event_loop(loop)
+        try:
+            holder['server'] = loop.run_until_complete(asyncio.start_server(handler, host, port))
+        except BaseException as e:
+            # ポートが使用中などで起動できなかった場合も、呼び出し側の待機を解いて例外を渡す
+            errors['start'] = e
+            return
+        finally:
+            started.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    started.wait()
+    if 'start' in errors:
+        thread.join()
+        loop.close()
+        raise errors['start']
+    server = holder['server']
+    try:
+        yield f'http://{host}:{server.sockets[0].getsockname()[1]}'
+    finally:
+        async def stop() -> None:
+            server.close()
+            await server.wait_closed()
+            # keep-aliveで待機中の接続も閉じる
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(stop(), loop).result(timeout=5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='httpbin.org互換のローカルサーバー')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--tail-ratio', type=float, default=0.0, help='応答を遅らせるリクエストの割合（0〜1）')
+    parser.add_argument('--tail-delay', type=float, default=0.0, help='遅らせる秒数')
+    parser.add_argument('--seed', type=int, help='どのリクエストを遅らせるかを決める乱数のシード')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.tail_ratio, args.tail_delay, args.seed))
+    except KeyboardInterrupt:
+        pass
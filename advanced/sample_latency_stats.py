@@ -0,0 +1,77 @@
+"""
+レイテンシなどの集計に使うヒストグラムとパーセンタイルの共通部品
+sample_http_timing.py・sample_http_hedging.py・sample_http_load.py・sample_async_monitor.py・sample_async_batcher.pyから使う。
+"""
+
+import bisect
+import threading
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+def percentile(sorted_values: Sequence[float], p: float) -> float:
+    """ソート済みの値からpパーセンタイル（0〜100）を返す（値がなければ0.0）"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * p / 100), len(sorted_values) - 1)]
+
+
+def percentiles(values: Iterable[float], ps: Iterable[float] = (50, 90, 99)) -> Dict[str, float]:
+    """{'p50': ..., 'p90': ...}の形式で、複数のパーセンタイルをまとめて返す"""
+    sorted_values = sorted(values)
+    return {f'p{p:g}': percentile(sorted_values, p) for p in ps}
+
+
+class BucketHistogram:
+    """上限値ごとの件数と合計を数えるヒストグラム。最後に上限なしのバケットがある"""
+
+    __slots__ = ('bounds', 'counts', 'total', 'count')
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """(上限, その上限以下の件数)のリスト。Prometheusのバケットと同じ形式"""
+        result = []
+        running = 0
+        for upper, count in zip(self.bounds + (float('inf'),), self.counts):
+            running += count
+            result.append((upper, running))
+        return result
+
+    def to_dict(self) -> Dict[str, int]:
+        labels = [f'<={bound:g}' for bound in self.bounds] + [f'>{self.bounds[-1]:g}']
+        return dict(zip(labels, self.counts))
+
+
+class SlidingWindow:
+    """直近window件の値を保持し、パーセンタイルを求める。スレッドセーフ"""
+
+    def __init__(self, window: int = 1000):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, value: float) -> None:
+        with self._lock:
+            self._samples.append(value)
+
+    def last(self) -> Optional[float]:
+        with self._lock:
+            return self._samples[-1] if self._samples else None
+
+    def percentile(self, p: float) -> Optional[float]:
+        """pパーセンタイル（0〜100）。値がなければNone"""
+        with self._lock:
+            samples = sorted(self._samples)
+        return percentile(samples, p) if samples else None
+
+    def __len__(self) -> int:
+        return len(self._samples)
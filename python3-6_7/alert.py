@@ -1,42 +1,342 @@
 import copy
+import gzip
+import heapq
+import io
 import json
-from typing import List
+import sys
+import time
+from collections.abc import Mapping, MutableMapping
+from typing import IO, Any, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple, Union
+
+
+class DeviceNotFoundError(Exception):
+    """アラートのimeiに対応するデバイスが見つからない場合の例外"""
+
+    def __init__(self, imeis: Iterable[str]):
+        self.imeis: List[str] = list(imeis)
+        super().__init__(f'device not found. imei={self.imeis}')
+
+    def __reduce__(self):
+        # プロセス間で受け渡す（pickleする）ときも、imeiのリストを復元できるようにする
+        return self.__class__, (self.imeis,)
+
+
+class DeviceIndex:
+    """
+    imeiをキーにしたデバイスの索引
+    デバイスリスト1つにつき1回だけ構築し、全アラートの検索で使い回す。
+    """
+
+    def __init__(self, device_list: List[dict]):
+        self._devices: Dict[str, dict] = {}
+        for device in device_list:
+            # 線形探索（next(filter(...))）と同じく、重複時は先頭のデバイスを優先する
+            self._devices.setdefault(device['imei'], device)
+
+    def get(self, imei: str) -> Optional[dict]:
+        return self._devices.get(imei)
+
+    def __contains__(self, imei: object) -> bool:
+        return imei in self._devices
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+
+class DeviceRegistry:
+    """
+    imeiをキーに、デバイスの全属性を保持し続けるレジストリ
+    追加・更新・削除を差分で反映でき、マージのたびにデバイスリストを走査し直す必要がない。
+    """
+
+    def __init__(self, device_list: Iterable[dict] = ()):
+        self._devices: Dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+        self.upsert_devices(device_list)
+
+    def upsert(self, imei: str, **attributes) -> None:
+        """デバイスを追加する。登録済みなら指定した属性だけを更新する"""
+        device = self._devices.setdefault(imei, {'imei': imei})
+        device.update(attributes)
+
+    def upsert_devices(self, device_list: Iterable[dict]) -> None:
+        for device in device_list:
+            self.upsert(device['imei'], **{key: value for key, value in device.items() if key != 'imei'})
+
+    def delete(self, imei: str) -> bool:
+        """デバイスを削除する。登録されていなかった場合はFalseを返す"""
+        return self._devices.pop(imei, None) is not None
+
+    def get(self, imei: str) -> Optional[dict]:
+        device = self._devices.get(imei)
+        if device is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return device
+
+    def stats(self) -> Dict[str, float]:
+        """フリートのカバー率を監視するための、ヒット・ミスの件数"""
+        total = self.hits + self.misses
+        return {
+            'devices': len(self._devices),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+
+    def __contains__(self, imei: object) -> bool:
+        return imei in self._devices
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+
+def select_latest(keys: Iterable[Tuple[Hashable, int]], k: int = 1) -> List[int]:
+    """
+    imeiごとに最新（event_idが大きい）k件のアラートの位置を求める
+
+    Args:
+        keys: アラートごとの(imei, event_id)
+        k: imeiごとに残す件数
+
+    Returns:
+        残すアラートの位置（入力順）
+    """
+    if k < 1:
+        raise ValueError(f'k must be positive. k={k}')
+    if k == 1:
+        # 1件だけ残す場合はヒープも不要で、imeiごとに最大値を持つだけの1パスで済む
+        latest: Dict[Hashable, Tuple[int, int]] = {}
+        for position, (imei, event_id) in enumerate(keys):
+            current = latest.get(imei)
+            if current is None or event_id >= current[0]:
+                latest[imei] = (event_id, position)
+        return sorted(position for _, position in latest.values())
+
+    # imeiごとにサイズkの最小ヒープを持ち、古いアラートから押し出す
+    heaps: Dict[Hashable, List[Tuple[int, int]]] = {}
+    for position, (imei, event_id) in enumerate(keys):
+        heap = heaps.setdefault(imei, [])
+        if len(heap) < k:
+            heapq.heappush(heap, (event_id, position))
+        else:
+            heapq.heappushpop(heap, (event_id, position))
+    return sorted(position for heap in heaps.values() for _, position in heap)
+
+
+class AlertRecord(MutableMapping):
+    """
+    コピーオンライトのアラート
+    変更していない項目は呼び出し元のdictをそのまま参照し、書き込み（event_type・label・device_type等）は
+    小さなオーバーレイのdictにだけ行う。呼び出し元のdictは書き換えない。
+    """
+    __slots__ = ('_base', '_overlay')
+
+    # 削除した項目をオーバーレイ上で表す目印
+    _DELETED = object()
+
+    def __init__(self, base: dict, overlay: Optional[dict] = None):
+        self._base = base
+        self._overlay = overlay if overlay is not None else {}
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._overlay:
+            value = self._overlay[key]
+            if value is self._DELETED:
+                raise KeyError(key)
+            return value
+        return self._base[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._overlay[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        if key in self._base:
+            self._overlay[key] = self._DELETED
+        else:
+            # オーバーレイにしかない項目は、目印を残さずにそのまま消す
+            del self._overlay[key]
+
+    def __iter__(self) -> Iterator[str]:
+        for key in self._base:
+            if self._overlay.get(key) is not self._DELETED:
+                yield key
+        for key, value in self._overlay.items():
+            if key not in self._base and value is not self._DELETED:
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f'AlertRecord({self.to_dict()!r})'
+
+    def to_dict(self) -> dict:
+        """通常のdictに変換する。キーの順序はdictを直接書き換えた場合と同じになる"""
+        alert = dict(self._base)
+        for key, value in self._overlay.items():
+            if value is self._DELETED:
+                alert.pop(key, None)
+            else:
+                alert[key] = value
+        return alert
+
+
+def dump_alerts(alerts: Iterable[Mapping], fp: IO, jsonl: bool = False, compact: bool = False,
+                compress: bool = False, chunk_size: int = 1000) -> int:
+    """
+    アラートを1件ずつJSONに変換しながらファイルに書き出す
+    json.dumps(全件)のように全体を1つの文字列にしないため、件数が増えてもメモリ使用量は一定になる。
+
+    Args:
+        alerts: アラートのイテレータ
+        fp: 書き込み先。compress=Trueの場合はバイナリモード、それ以外はテキストモードで開いたもの
+        jsonl: Trueなら1行1アラートのJSONL、FalseならJSON配列で書き出す
+        compact: Trueならインデントや空白を入れずに書き出す（JSONLは常にcompact）
+        compress: Trueならgzipで圧縮して書き出す
+        chunk_size: 何件分ずつまとめてfpに書き込むか
+
+    Returns:
+        書き出したアラートの件数
+    """
+    if compress:
+        gzip_file = gzip.GzipFile(fileobj=fp, mode='wb')
+        text = io.TextIOWrapper(gzip_file, encoding='utf-8')
+        try:
+            return dump_alerts(alerts, text, jsonl, compact, False, chunk_size)
+        finally:
+            # fp自体は閉じずに、gzipの終端だけを書き込む
+            text.flush()
+            text.detach()
+            gzip_file.close()
+
+    indent = None if compact or jsonl else 4
+    separators = (',', ':') if compact or jsonl else None
+    pad = '' if indent is None else '\n' + ' ' * indent
+
+    count = 0
+    chunk: List[str] = []
+    if not jsonl:
+        chunk.append('[')
+    for alert in alerts:
+        if isinstance(alert, AlertRecord):
+            alert = alert.to_dict()
+        encoded = json.dumps(alert, indent=indent, separators=separators)
+        if jsonl:
+            chunk.append(encoded + '\n')
+        else:
+            # json.dumps(リスト, indent=4)と同じ見た目になるよう、要素ごとに1段インデントする
+            chunk.append(('' if count == 0 else ',') + pad + encoded.replace('\n', pad))
+        count += 1
+        if len(chunk) >= chunk_size:
+            fp.write(''.join(chunk))
+            chunk.clear()
+    if not jsonl:
+        chunk.append('\n]' if count and indent is not None else ']')
+    fp.write(''.join(chunk))
+    return count
 
 
 class AlertEvent:
     def __init__(self, alert_event_list):
-        self._alert_list: List[dict] = copy.deepcopy(alert_event_list)
-        for alert in self._alert_list:
-            alert['event_type'] = 'option' if alert['event_type'] == 1 else 'crash'
+        # deepcopyせず、event_typeの変換結果だけをオーバーレイに持つ
+        self._alert_list: List[AlertRecord] = [
+            AlertRecord(alert, {'event_type': 'option' if alert['event_type'] == 1 else 'crash'})
+            for alert in alert_event_list
+        ]
 
-    def filter_latest_alert(self):
-        _alert_list = []
-        for alert in self._alert_list:
-            _alert_list.append(alert)
-        self._alert_list = _alert_list
+    def filter_latest_alert(self, k: int = 1):
+        """imeiごとに最新k件のアラートだけを残す。後続のマージより前に呼ぶと処理件数を減らせる"""
+        positions = select_latest(((alert['imei'], alert['event_id']) for alert in self._alert_list), k)
+        self._alert_list = [self._alert_list[position] for position in positions]
         return self
 
-    def merge_device_label(self, device_list: List[dict]):
-        return self._merge_device(device_list, 'label')
+    def merge_device_label(self, device_list: Union[List[dict], DeviceIndex, DeviceRegistry], strict: bool = True):
+        return self._merge_device(device_list, 'label', strict=strict)
 
-    def merge_device_type(self, device_list: List[dict]):
-        return self._merge_device(device_list, 'device_type')
+    def merge_device_type(self, device_list: Union[List[dict], DeviceIndex, DeviceRegistry], strict: bool = True):
+        return self._merge_device(device_list, 'device_type', strict=strict)
 
-    def _merge_device(self, device_list: List[dict], key: str):
-        _alert_list = []
+    def merge_device_attributes(self, registry: DeviceRegistry, keys: Iterable[str], strict: bool = True):
+        """レジストリから、指定した複数の属性を1回の走査でまとめてマージする"""
+        return self._merge_device(registry, *keys, strict=strict)
+
+    def _merge_device(self, device_list: Union[List[dict], DeviceIndex, DeviceRegistry], *keys: str,
+                      strict: bool = True):
+        """
+        アラートにデバイスの属性をマージする
+
+        Args:
+            device_list: デバイスリスト、または構築済みのDeviceIndex・DeviceRegistry
+            keys: マージするデバイスの属性名
+            strict: Trueなら最初の未登録imeiで例外、Falseなら全件処理後に未登録imeiをまとめて例外にする
+                （指定した属性のどれかを持たないデバイスも未登録として扱う）
+        """
+        # デバイスごとに線形探索するとO(alerts × devices)になるため、先に索引を作る
+        index = device_list if isinstance(device_list, (DeviceIndex, DeviceRegistry)) else DeviceIndex(device_list)
+        unmatched: Dict[str, None] = {}
         for alert in self._alert_list:
-            device = next(filter(lambda x: x['imei'] == alert['imei'], device_list), None)
-            if device is None:
-                raise Exception('')
-            alert[key] = device[key]
+            device = index.get(alert['imei'])
+            # DeviceRegistryは一部の属性だけを登録できるため、属性が欠けているデバイスも未登録と同じに扱う
+            if device is None or any(key not in device for key in keys):
+                if strict:
+                    raise DeviceNotFoundError([alert['imei']])
+                unmatched[alert['imei']] = None
+                continue
+            for key in keys:
+                alert[key] = device[key]
+        if unmatched:
+            raise DeviceNotFoundError(unmatched)
         return self
 
     def sort_by_date_time(self):
         self._alert_list.sort(key=lambda x: x['label'], reverse=True)
         return self
 
-    def to_list(self):
-        return self._alert_list
+    def to_list(self) -> List[dict]:
+        return [alert.to_dict() for alert in self._alert_list]
+
+    def dump(self, fp: IO, jsonl: bool = False, compact: bool = False, compress: bool = False,
+             chunk_size: int = 1000) -> int:
+        """to_list()でdictのリストを作らずに、1件ずつJSONに書き出す。引数はdump_alertsと同じ"""
+        return dump_alerts(self._alert_list, fp, jsonl, compact, compress, chunk_size)
+
+
+def benchmark_merge_device(sizes: Iterable[int] = (25_000, 50_000, 100_000, 200_000)) -> None:
+    """merge_device_labelの処理時間を計測し、アラート件数に対して線形に伸びることを確認する"""
+    print('alerts    devices   seconds   usec/alert')
+    for size in sizes:
+        device_count = max(size // 7, 1)
+        devices = [{'imei': f'imei-{i}', 'label': f'label-{i}'} for i in range(device_count)]
+        alerts = [{'event_id': i, 'event_type': 1, 'imei': f'imei-{i % device_count}'} for i in range(size)]
+        alert_event = AlertEvent(alerts)
+
+        start = time.perf_counter()
+        alert_event.merge_device_label(devices)
+        elapsed = time.perf_counter() - start
+        print(f'{size:<9} {device_count:<9} {elapsed:<9.4f} {elapsed / size * 1_000_000:.3f}')
+
+
+def benchmark_copy(sizes: Iterable[int] = (25_000, 50_000, 100_000, 200_000)) -> None:
+    """AlertEventの生成にかかる時間を、従来のcopy.deepcopyによる方式と比較する"""
+    print('alerts    deepcopy  record    speedup')
+    for size in sizes:
+        alerts = [{'event_id': i, 'event_type': 1 + i % 2, 'imei': f'imei-{i % 1000}'} for i in range(size)]
+
+        start = time.perf_counter()
+        _alert_list = copy.deepcopy(alerts)
+        for alert in _alert_list:
+            alert['event_type'] = 'option' if alert['event_type'] == 1 else 'crash'
+        deepcopy_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        AlertEvent(alerts)
+        record_elapsed = time.perf_counter() - start
+        print(f'{size:<9} {deepcopy_elapsed:<9.4f} {record_elapsed:<9.4f} {deepcopy_elapsed / record_elapsed:.1f}x')
 
 
 __alert_event = [
@@ -74,12 +374,43 @@ __device_list_2 = [
     }
 ]
 
-alert_list = (
-    AlertEvent(__alert_event)
-    .filter_latest_alert()
-    .merge_device_label(__device_list_1).merge_device_type(__device_list_2)
-    .sort_by_date_time()
-    .to_list()
-)
+if __name__ == '__main__':
+    # json.dumps(alert_list, indent=4)と同じ内容を、全体を文字列にせずに書き出す
+    (
+        AlertEvent(__alert_event)
+        .filter_latest_alert()
+        .merge_device_label(__device_list_1).merge_device_type(__device_list_2)
+        .sort_by_date_time()
+        .dump(sys.stdout)
+    )
+    print()
+
+    # 未登録のimeiは、strict=Falseにすると最初の1件で止まらずにまとめて報告される
+    try:
+        AlertEvent(__alert_event + [{'event_id': 3, 'event_type': 1, 'imei': 'c0001'},
+                                    {'event_id': 4, 'event_type': 1, 'imei': 'd0001'}]) \
+            .merge_device_label(__device_list_1, strict=False)
+    except DeviceNotFoundError as e:
+        print(e.imeis)
+
+    # 索引は1回だけ作って、複数回のマージで使い回せる
+    index = DeviceIndex(__device_list_1)
+    print(AlertEvent(__alert_event).merge_device_label(index).to_list())
+
+    # レジストリには複数のデバイスリストの属性をまとめて登録でき、差分で更新できる
+    registry = DeviceRegistry(__device_list_1)
+    registry.upsert_devices(__device_list_2)
+    registry.upsert('b0001', label='label-2b')
+    print(AlertEvent(__alert_event).merge_device_attributes(registry, ['label', 'device_type']).to_list())
+    registry.delete('a0001')
+    try:
+        AlertEvent(__alert_event).merge_device_attributes(registry, ['label'])
+    except DeviceNotFoundError as e:
+        print(e.imeis)
+    print(registry.stats())
+
+    # 呼び出し元のデータは書き換えられていない
+    print(__alert_event)
 
-print(json.dumps(alert_list, indent=4))
+    benchmark_merge_device()
+    benchmark_copy()
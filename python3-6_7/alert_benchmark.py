@@ -0,0 +1,221 @@
+"""
+アラート処理（alert.py）のベンチマーク
+件数・デバイス数・imeiごとのアラートの偏り（Zipf分布の指数）を指定して合成データを作り、
+AlertEventの各ステージとチェーン全体の処理時間、tracemallocによるピークメモリを計測する。
+filter_latest_alertは後続ステージの件数をデバイス数以下に絞るため、後続ステージのスケーリングを見るときは--no-filterを付ける。
+lazy・streamは実際の処理がto_list()でまとめて行われるため、チェーン全体だけを計測する。
+結果はJSONで書き出せるので、コミット間で比較できる。
+
+実行例:
+    python alert_benchmark.py --sizes 10000 20000 40000 80000 --devices 5000 --skew 1.1 --output result.json
+    python alert_benchmark.py --no-filter --backend columnar
+"""
+import argparse
+import json
+import math
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from alert import AlertEvent
+from alert_columnar import ColumnarAlertEvent
+from alert_lazy import LazyAlertEvent
+from alert_stream import StreamingAlertEvent
+
+BACKENDS: Dict[str, Callable[[List[dict]], Any]] = {
+    'row': AlertEvent,
+    'columnar': ColumnarAlertEvent,
+    'lazy': LazyAlertEvent,
+    'stream': lambda alerts: StreamingAlertEvent(iter(alerts)),
+}
+
+STAGES = ('init', 'filter_latest_alert', 'merge_device_label', 'merge_device_type', 'sort_by_date_time', 'to_list')
+
+# メソッドチェーンでは処理を記録するだけで、ステージごとの時間に意味がないバックエンド
+DEFERRED_BACKENDS = ('lazy', 'stream')
+
+
+def generate_devices(device_count: int) -> Tuple[List[dict], List[dict]]:
+    """merge_device_label用とmerge_device_type用のデバイスリストを作る"""
+    labels = [{'imei': f'imei-{i:08d}', 'label': f'label-{i % 997:04d}'} for i in range(device_count)]
+    types = [{'imei': f'imei-{i:08d}', 'device_type': f'type-{i % 7}'} for i in range(device_count)]
+    return labels, types
+
+
+def generate_alerts(alert_count: int, device_count: int, skew: float = 0.0, seed: int = 0) -> List[dict]:
+    """
+    アラートを作る
+
+    Args:
+        alert_count: アラート件数
+        device_count: アラートを発生させるデバイス数
+        skew: imeiごとのアラート件数の偏り。0なら一様、大きいほど一部のデバイスにアラートが集中する
+        seed: 乱数のシード
+    """
+    rng = random.Random(seed)
+    weights = [1 / (rank ** skew) for rank in range(1, device_count + 1)]
+    devices = rng.choices(range(device_count), weights=weights, k=alert_count)
+    return [
+        {'event_id': event_id, 'event_type': rng.choice((1, 2)), 'imei': f'imei-{device:08d}'}
+        for event_id, device in enumerate(devices)
+    ]
+
+
+def _run_stages(backend: str, alerts: List[dict], label_devices: List[dict], type_devices: List[dict],
+                measure: Callable[[str, Callable[[], Any]], Any], filter_latest: bool) -> None:
+    alert_event = measure('init', lambda: BACKENDS[backend](alerts))
+    if filter_latest:
+        measure('filter_latest_alert', alert_event.filter_latest_alert)
+    measure('merge_device_label', lambda: alert_event.merge_device_label(label_devices))
+    measure('merge_device_type', lambda: alert_event.merge_device_type(type_devices))
+    measure('sort_by_date_time', alert_event.sort_by_date_time)
+    measure('to_list', alert_event.to_list)
+
+
+def run_once(backend: str, alert_count: int, device_count: int, skew: float, seed: int = 0,
+             filter_latest: bool = True) -> Dict[str, Any]:
+    """1つの入力サイズについて、ステージごとの処理時間とピークメモリを計測する"""
+    alerts = generate_alerts(alert_count, device_count, skew, seed)
+    label_devices, type_devices = generate_devices(device_count)
+
+    # tracemallocは処理時間を大きく伸ばすため、時間とメモリは別々に計測する
+    seconds: Dict[str, float] = {}
+
+    def measure_time(stage: str, func: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        result = func()
+        seconds[stage] = time.perf_counter() - start
+        return result
+
+    _run_stages(backend, alerts, label_devices, type_devices, measure_time, filter_latest)
+
+    peak_bytes: Dict[str, int] = {}
+    # ステージごとにピークをリセットするため、チェーン全体のピークは各ステージのピークの最大値で求める
+    chain_peak = 0
+
+    def measure_memory(stage: str, func: Callable[[], Any]) -> Any:
+        nonlocal chain_peak
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+        peak_bytes[stage] = peak - base
+        chain_peak = max(chain_peak, peak - start_memory)
+        return result
+
+    tracemalloc.start()
+    try:
+        start_memory, _ = tracemalloc.get_traced_memory()
+        _run_stages(backend, alerts, label_devices, type_devices, measure_memory, filter_latest)
+    finally:
+        tracemalloc.stop()
+
+    stages = [] if backend in DEFERRED_BACKENDS else [stage for stage in STAGES if stage in seconds]
+    return {
+        'backend': backend,
+        'alerts': alert_count,
+        'devices': device_count,
+        'skew': skew,
+        'filter_latest': filter_latest,
+        'stages': {stage: {'seconds': seconds[stage], 'peak_bytes': peak_bytes[stage]} for stage in stages},
+        'chain': {'seconds': sum(seconds.values()), 'peak_bytes': chain_peak},
+    }
+
+
+def _reported_stages(runs: List[Dict[str, Any]]) -> Tuple[str, ...]:
+    return tuple(runs[0]['stages']) + ('chain',) if runs else ()
+
+
+def scaling_exponents(runs: List[Dict[str, Any]]) -> Dict[str, float]:
+    """
+    最小と最大の入力サイズの間で、処理時間が件数の何乗で伸びているかを求める
+    1.0付近なら線形、2.0付近なら二乗で伸びている。
+    """
+    if len(runs) < 2:
+        return {}
+    first, last = runs[0], runs[-1]
+    size_ratio = math.log(last['alerts'] / first['alerts'])
+    exponents = {}
+    for stage in _reported_stages(runs):
+        before = first['chain'] if stage == 'chain' else first['stages'][stage]
+        after = last['chain'] if stage == 'chain' else last['stages'][stage]
+        if before['seconds'] > 0 and after['seconds'] > 0:
+            exponents[stage] = math.log(after['seconds'] / before['seconds']) / size_ratio
+    return exponents
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(runs: List[Dict[str, Any]], exponents: Dict[str, float]) -> None:
+    """ステージごとに、入力サイズ別の処理時間（ms）とピークメモリ（KiB）、伸び方の指数を表示する"""
+    print(f'{"stage":<22}' + ''.join(f'{run["alerts"]:>20}' for run in runs) + f'{"exponent":>10}')
+    for stage in _reported_stages(runs):
+        row = f'{stage:<22}'
+        for run in runs:
+            result = run['chain'] if stage == 'chain' else run['stages'][stage]
+            row += f'{result["seconds"] * 1000:>9.1f}ms {result["peak_bytes"] / 1024:>7.0f}K'
+        exponent = exponents.get(stage)
+        row += f'{exponent:>10.2f}' if exponent is not None else f'{"-":>10}'
+        print(row)
+
+
+def plot_scaling(runs: List[Dict[str, Any]], path: str) -> None:
+    """ステージごとのスケーリング曲線（両対数）を画像に保存する"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    sizes = [run['alerts'] for run in runs]
+    fig, ax = plt.subplots()
+    for stage in _reported_stages(runs):
+        ax.plot(sizes, [(run['chain'] if stage == 'chain' else run['stages'][stage])['seconds'] for run in runs],
+                marker='o', label=stage)
+    ax.set_xscale('log')
+    ax.set_yscale('log')
+    ax.set_xlabel('alerts')
+    ax.set_ylabel('seconds')
+    ax.legend()
+    fig.savefig(path)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='alert.pyのベンチマーク')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='row')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 20_000, 40_000, 80_000])
+    parser.add_argument('--devices', type=int, default=5_000)
+    parser.add_argument('--skew', type=float, default=0.0, help='imeiごとのアラート件数の偏り（Zipf分布の指数）')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-filter', dest='filter_latest', action='store_false',
+                        help='filter_latest_alertを呼ばず、後続ステージに全件を流す')
+    parser.add_argument('--output', help='結果を書き出すJSONファイル')
+    parser.add_argument('--plot', help='スケーリング曲線を保存する画像ファイル（matplotlibが必要）')
+    args = parser.parse_args(argv)
+
+    runs = [run_once(args.backend, size, args.devices, args.skew, args.seed, args.filter_latest)
+            for size in sorted(args.sizes)]
+    exponents = scaling_exponents(runs)
+    print_report(runs, exponents)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'commit': _git_commit(),
+                'python': platform.python_version(),
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'runs': runs,
+                'scaling_exponents': exponents,
+            }, f, indent=4)
+    if args.plot:
+        plot_scaling(runs, args.plot)
+
+
+if __name__ == '__main__':
+    main()
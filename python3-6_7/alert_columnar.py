@@ -0,0 +1,160 @@
+"""
+AlertEventの列指向（カラムナ）版
+行ごとのdictを持たず、event_id・event_type・imeiをarray.arrayの列として保持する。
+event_typeは整数コード、imeiとマージした属性は辞書エンコード（重複しない値のリスト＋そのインデックス）で持つ。
+dictを組み立てるのはto_list()のみ。
+"""
+import json
+import sys
+import tracemalloc
+from array import array
+from typing import Dict, List, Union
+
+from alert import AlertEvent, DeviceIndex, DeviceNotFoundError, select_latest
+
+EVENT_TYPES = ('option', 'crash')
+
+
+class _DictionaryColumn:
+    """値をインデックス（array）と重複しない値のリストで持つ列"""
+
+    def __init__(self, codes: array, values: list):
+        self.codes = codes
+        self.values = values
+
+    def take(self, order: List[int]) -> '_DictionaryColumn':
+        return _DictionaryColumn(array(self.codes.typecode, map(self.codes.__getitem__, order)), self.values)
+
+
+class ColumnarAlertEvent:
+    """
+    列指向で保持するAlertEvent
+    AlertEventと同じメソッドチェーンで使える。
+    保持するのはevent_id・event_type・imeiとマージした属性のみで、それ以外の入力フィールドは保持しない。
+    """
+
+    def __init__(self, alert_event_list: List[dict]):
+        self._event_id = array('q')
+        self._event_type = array('b')
+        imei_codes = array('i')
+        imeis: List[str] = []
+        imei_to_code: Dict[str, int] = {}
+        for alert in alert_event_list:
+            self._event_id.append(alert['event_id'])
+            self._event_type.append(0 if alert['event_type'] == 1 else 1)
+            code = imei_to_code.get(alert['imei'])
+            if code is None:
+                code = imei_to_code[alert['imei']] = len(imeis)
+                imeis.append(sys.intern(alert['imei']))
+            imei_codes.append(code)
+        self._imei = _DictionaryColumn(imei_codes, imeis)
+        # マージした属性（キー名 -> 列）。to_list()でのキー順を保つためdictの挿入順を使う
+        self._attributes: Dict[str, _DictionaryColumn] = {}
+
+    def __len__(self) -> int:
+        return len(self._event_id)
+
+    def filter_latest_alert(self, k: int = 1):
+        # imeiは文字列ではなくコードのまま比較する
+        self._take(select_latest(zip(self._imei.codes, self._event_id), k))
+        return self
+
+    def merge_device_label(self, device_list: Union[List[dict], DeviceIndex], strict: bool = True):
+        return self._merge_device(device_list, 'label', strict)
+
+    def merge_device_type(self, device_list: Union[List[dict], DeviceIndex], strict: bool = True):
+        return self._merge_device(device_list, 'device_type', strict)
+
+    def _merge_device(self, device_list: Union[List[dict], DeviceIndex], key: str, strict: bool = True):
+        index = device_list if isinstance(device_list, DeviceIndex) else DeviceIndex(device_list)
+
+        # 索引の検索は重複しないimeiごとに1回だけ行い、imeiコード -> 値コードの変換表を作る
+        values: list = []
+        value_to_code: Dict[object, int] = {}
+        imei_to_value = array('i')
+        unmatched: List[str] = []
+        for imei in self._imei.values:
+            device = index.get(imei)
+            if device is None:
+                if strict:
+                    raise DeviceNotFoundError([imei])
+                unmatched.append(imei)
+                imei_to_value.append(-1)
+                continue
+            code = value_to_code.get(device[key])
+            if code is None:
+                code = value_to_code[device[key]] = len(values)
+                values.append(device[key])
+            imei_to_value.append(code)
+        if unmatched:
+            raise DeviceNotFoundError(unmatched)
+
+        # 行ごとの処理は変換表の参照だけにして、mapでまとめて適用する
+        codes = array('i', map(imei_to_value.__getitem__, self._imei.codes))
+        self._attributes[key] = _DictionaryColumn(codes, values)
+        return self
+
+    def sort_by_date_time(self):
+        label = self._attributes['label']
+        # 値の順位を先に求めておけば、行ごとの比較は整数同士で済む
+        rank = array('i', [0] * len(label.values))
+        for position, code in enumerate(sorted(range(len(label.values)), key=label.values.__getitem__)):
+            rank[code] = position
+        row_rank = array('i', map(rank.__getitem__, label.codes))
+        self._take(sorted(range(len(self)), key=row_rank.__getitem__, reverse=True))
+        return self
+
+    def _take(self, order: List[int]) -> None:
+        """全ての列を、指定した位置の行だけ・指定した順に並べ替える"""
+        self._event_id = array('q', map(self._event_id.__getitem__, order))
+        self._event_type = array('b', map(self._event_type.__getitem__, order))
+        self._imei = self._imei.take(order)
+        self._attributes = {key: column.take(order) for key, column in self._attributes.items()}
+
+    def to_list(self) -> List[dict]:
+        _alert_list = []
+        for row in range(len(self)):
+            alert = {
+                'event_id': self._event_id[row],
+                'event_type': EVENT_TYPES[self._event_type[row]],
+                'imei': self._imei.values[self._imei.codes[row]],
+            }
+            for key, column in self._attributes.items():
+                alert[key] = column.values[column.codes[row]]
+            _alert_list.append(alert)
+        return _alert_list
+
+
+def compare_memory(size: int = 100_000, device_count: int = 10_000) -> None:
+    """AlertEventとColumnarAlertEventで、マージ後に保持しているメモリ量を比較する"""
+    devices = [{'imei': f'imei-{i}', 'label': f'label-{i}', 'device_type': f'type-{i % 5}'}
+               for i in range(device_count)]
+    alerts = [{'event_id': i, 'event_type': 1 + i % 2, 'imei': f'imei-{i % device_count}'} for i in range(size)]
+
+    for cls in (AlertEvent, ColumnarAlertEvent):
+        tracemalloc.start()
+        alert_event = cls(alerts).merge_device_label(devices).merge_device_type(devices)
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'{cls.__name__:<20} {current / size:8.1f} bytes/alert')
+        del alert_event
+
+
+if __name__ == '__main__':
+    __alert_event = [
+        {'event_id': 1, 'event_type': 1, 'imei': 'a0001'},
+        {'event_id': 2, 'event_type': 2, 'imei': 'b0001'},
+    ]
+    __device_list_1 = [{'imei': 'a0001', 'label': 'label-1'}, {'imei': 'b0001', 'label': 'label-2'}]
+    __device_list_2 = [{'imei': 'a0001', 'device_type': 'type-1'}, {'imei': 'b0001', 'device_type': 'type-2'}]
+
+    alert_list = (
+        ColumnarAlertEvent(__alert_event)
+        .filter_latest_alert()
+        .merge_device_label(__device_list_1).merge_device_type(__device_list_2)
+        .sort_by_date_time()
+        .to_list()
+    )
+    print(json.dumps(alert_list, indent=4))
+
+    compare_memory()
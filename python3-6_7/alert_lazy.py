@@ -0,0 +1,144 @@
+"""
+AlertEventの遅延評価版
+メソッドチェーンでは処理を実行せず、操作をプランとして記録するだけにする。
+to_list()の呼び出し時にプランを最適化し、event_typeの変換とデバイス属性のマージを1回の走査にまとめて実行する。
+"""
+import json
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from alert import DeviceIndex, DeviceNotFoundError, select_latest
+
+
+class _Merge(NamedTuple):
+    key: str
+    index: DeviceIndex
+    strict: bool
+
+
+class _FilterLatest(NamedTuple):
+    k: int
+
+
+class _Sort(NamedTuple):
+    pass
+
+
+class LazyAlertEvent:
+    def __init__(self, alert_event_list: List[dict]):
+        # 入力は参照だけ保持し、to_list()で新しいdictを組み立てるためコピーしない
+        self._source = alert_event_list
+        self._plan: List[Union[_Merge, _FilterLatest, _Sort]] = []
+
+    def filter_latest_alert(self, k: int = 1):
+        self._plan.append(_FilterLatest(k))
+        return self
+
+    def merge_device_label(self, device_list: Union[List[dict], DeviceIndex], strict: bool = True):
+        return self._merge_device(device_list, 'label', strict)
+
+    def merge_device_type(self, device_list: Union[List[dict], DeviceIndex], strict: bool = True):
+        return self._merge_device(device_list, 'device_type', strict)
+
+    def _merge_device(self, device_list: Union[List[dict], DeviceIndex], key: str, strict: bool = True):
+        # 索引はプランに記録する時点で作り、実行時は検索のみ行う
+        index = device_list if isinstance(device_list, DeviceIndex) else DeviceIndex(device_list)
+        self._plan.append(_Merge(key, index, strict))
+        return self
+
+    def sort_by_date_time(self):
+        self._plan.append(_Sort())
+        return self
+
+    def _optimize(self) -> Tuple[Optional[int], List[_Merge], bool]:
+        """
+        プランを最適化する
+
+        Returns:
+            imeiごとに残す件数（絞り込まない場合はNone）、1回の走査でまとめて適用するマージの一覧、
+            最後にソートするかどうか
+        """
+        latest_k: Optional[int] = None
+        merges: List[_Merge] = []
+        sort = False
+        for step in self._plan:
+            if isinstance(step, _FilterLatest):
+                # 最新k件の絞り込みを重ねた場合は、小さい方のkだけが効く
+                latest_k = step.k if latest_k is None else min(latest_k, step.k)
+            elif isinstance(step, _Merge):
+                merges.append(step)
+            elif isinstance(step, _Sort):
+                # マージは行の順序を変えないため、ソートは最後に1回だけ行えばよい
+                sort = True
+        # 絞り込みはimei単位なので、マージより前に移しても結果は変わらない
+        return latest_k, merges, sort
+
+    def explain(self) -> str:
+        """最適化後の実行プランを表示する"""
+        latest_k, merges, sort = self._optimize()
+        lines = [f'Scan(alerts={len(self._source)})']
+        if latest_k is not None:
+            lines.append(f'  -> FilterLatest(key=imei, k={latest_k})')
+        lines.append('  -> Map(event_type)')
+        for merge in merges:
+            lines.append(f'  -> Merge(key={merge.key}, devices={len(merge.index)}, strict={merge.strict})')
+        if sort:
+            lines.append('  -> Sort(key=label, reverse=True)')
+        plan = '\n'.join(lines)
+        print(plan)
+        return plan
+
+    @staticmethod
+    def _raise_first_failure(sources: List[dict], merges: List[_Merge]) -> None:
+        """AlertEventと同じく、プランの順にマージを見て、最初に失敗したマージの例外だけを送出する"""
+        for merge in merges:
+            unmatched: Dict[str, None] = {}
+            for source in sources:
+                if source['imei'] not in merge.index:
+                    if merge.strict:
+                        raise DeviceNotFoundError([source['imei']])
+                    unmatched[source['imei']] = None
+            if unmatched:
+                raise DeviceNotFoundError(unmatched)
+
+    def to_list(self) -> List[dict]:
+        latest_k, merges, sort = self._optimize()
+
+        sources = self._source
+        if latest_k is not None:
+            positions = select_latest(((alert['imei'], alert['event_id']) for alert in sources), latest_k)
+            sources = [sources[position] for position in positions]
+
+        _alert_list = []
+        for source in sources:
+            alert = dict(source)
+            alert['event_type'] = 'option' if alert['event_type'] == 1 else 'crash'
+            for merge in merges:
+                device = merge.index.get(alert['imei'])
+                if device is None:
+                    # 失敗したときだけ、どのマージで失敗したかをプランの順に調べ直す
+                    self._raise_first_failure(sources, merges)
+                alert[merge.key] = device[merge.key]
+            _alert_list.append(alert)
+
+        if sort:
+            _alert_list.sort(key=lambda x: x['label'], reverse=True)
+        return _alert_list
+
+
+if __name__ == '__main__':
+    __alert_event = [
+        {'event_id': 1, 'event_type': 1, 'imei': 'a0001'},
+        {'event_id': 2, 'event_type': 2, 'imei': 'b0001'},
+    ]
+    __device_list_1 = [{'imei': 'a0001', 'label': 'label-1'}, {'imei': 'b0001', 'label': 'label-2'}]
+    __device_list_2 = [{'imei': 'a0001', 'device_type': 'type-1'}, {'imei': 'b0001', 'device_type': 'type-2'}]
+
+    alert_event = (
+        LazyAlertEvent(__alert_event)
+        .filter_latest_alert()
+        .merge_device_label(__device_list_1).merge_device_type(__device_list_2)
+        .sort_by_date_time()
+    )
+    # この時点ではまだ何も実行されていない
+    alert_event.explain()
+    print(json.dumps(alert_event.to_list(), indent=4))
@@ -0,0 +1,207 @@
+"""
+AlertEventのマルチプロセス版
+アラートをimeiのハッシュでパーティションに分け、ProcessPoolExecutorの各ワーカーで処理する。
+ワーカーには担当パーティションのアラートとデバイスだけを渡し、ソート済みの結果をk-wayマージして1つにする。
+"""
+import heapq
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, NamedTuple, Optional, Tuple
+
+from alert import AlertEvent, DeviceNotFoundError, select_latest
+
+
+def partition_of(imei: str, partitions: int) -> int:
+    # str.__hash__はプロセスごとに値が変わるため、crc32で安定したパーティションを決める
+    return zlib.crc32(imei.encode('utf-8')) % partitions
+
+
+class _Merge(NamedTuple):
+    key: str
+    device_list: List[dict]
+    strict: bool
+
+
+class _Partition(NamedTuple):
+    alerts: List[dict]
+    positions: List[int]
+    merges: List[_Merge]
+    latest_k: Optional[int]
+    sort: bool
+
+
+class _Result(NamedTuple):
+    alerts: List[Tuple[int, dict]]
+    failed_merge: Optional[int]
+    unmatched: List[Tuple[int, str]]
+
+
+def _sort_key(item: Tuple[int, dict]) -> Tuple[str, int]:
+    # 同じlabelは入力順に並べる（AlertEventの安定ソートと同じ順序にする）
+    position, alert = item
+    return alert['label'], -position
+
+
+def _run_partition(partition: _Partition) -> _Result:
+    """
+    1つのパーティションをワーカー上で処理する
+
+    Returns:
+        入力上の位置と処理結果の組。マージが失敗した場合は、そのマージの番号と、見つからなかったimeiとその位置
+    """
+    alerts, positions = partition.alerts, partition.positions
+    if partition.latest_k is not None:
+        # 絞り込みで残った行の入力上の位置を保つため、AlertEventに渡す前に絞り込む
+        kept = select_latest(((alert['imei'], alert['event_id']) for alert in alerts), partition.latest_k)
+        alerts = [alerts[index] for index in kept]
+        positions = [positions[index] for index in kept]
+
+    # マージは行の順序を変えないため、AlertEventの行とpositionsは同じ順に並んだままになる
+    alert_event = AlertEvent(alerts)
+    for number, merge in enumerate(partition.merges):
+        try:
+            alert_event._merge_device(merge.device_list, merge.key, strict=merge.strict)
+        except DeviceNotFoundError as e:
+            # AlertEventと同じく最初に失敗したマージで打ち切り、どの行で見つからなかったかを親に返す
+            imeis = set(e.imeis)
+            unmatched = {}
+            for alert, position in zip(alerts, positions):
+                if alert['imei'] in imeis and alert['imei'] not in unmatched:
+                    unmatched[alert['imei']] = position
+            return _Result([], number, [(position, imei) for imei, position in unmatched.items()])
+
+    result = list(zip(positions, alert_event.to_list()))
+    if partition.sort:
+        result.sort(key=_sort_key, reverse=True)
+    return _Result(result, None, [])
+
+
+class ParallelAlertEvent:
+    """
+    複数プロセスで処理するAlertEvent
+    メソッドチェーンでは処理を記録するだけで、to_list()でまとめて実行する。
+    結果の順序（sort_by_date_time()で同じlabelになったものを含む）はAlertEventと同じになる。
+    """
+
+    def __init__(self, alert_event_list: List[dict], workers: Optional[int] = None,
+                 partitions: Optional[int] = None, chunk_size: int = 1):
+        """
+        Args:
+            alert_event_list: アラートのリスト
+            workers: ワーカープロセス数（デフォルトはCPU数）
+            partitions: パーティション数（デフォルトはワーカー数の4倍。偏りがあっても負荷が均されやすい）
+            chunk_size: ワーカーへの1回の受け渡しにまとめるパーティション数
+        """
+        self._source = alert_event_list
+        self._workers = workers or os.cpu_count() or 1
+        self._partitions = partitions or self._workers * 4
+        self._chunk_size = chunk_size
+        self._merges: List[_Merge] = []
+        self._latest_k: Optional[int] = None
+        self._sort = False
+
+    def filter_latest_alert(self, k: int = 1):
+        # imeiが同じアラートは必ず同じパーティションに入るため、ワーカーごとに絞り込める
+        self._latest_k = k if self._latest_k is None else min(self._latest_k, k)
+        return self
+
+    def merge_device_label(self, device_list: List[dict], strict: bool = True):
+        self._merges.append(_Merge('label', device_list, strict))
+        return self
+
+    def merge_device_type(self, device_list: List[dict], strict: bool = True):
+        self._merges.append(_Merge('device_type', device_list, strict))
+        return self
+
+    def sort_by_date_time(self):
+        self._sort = True
+        return self
+
+    def _split(self) -> List[_Partition]:
+        alerts: List[List[dict]] = [[] for _ in range(self._partitions)]
+        positions: List[List[int]] = [[] for _ in range(self._partitions)]
+        for position, alert in enumerate(self._source):
+            number = partition_of(alert['imei'], self._partitions)
+            alerts[number].append(alert)
+            positions[number].append(position)
+
+        # デバイスリストも同じ規則で分け、各ワーカーには担当分だけを送る
+        merges: List[List[_Merge]] = [[] for _ in range(self._partitions)]
+        for merge in self._merges:
+            devices: List[List[dict]] = [[] for _ in range(self._partitions)]
+            for device in merge.device_list:
+                devices[partition_of(device['imei'], self._partitions)].append(device)
+            for number in range(self._partitions):
+                merges[number].append(_Merge(merge.key, devices[number], merge.strict))
+
+        return [_Partition(alerts[number], positions[number], merges[number], self._latest_k, self._sort)
+                for number in range(self._partitions) if alerts[number]]
+
+    def to_list(self) -> List[dict]:
+        with ProcessPoolExecutor(max_workers=self._workers) as executor:
+            results = list(executor.map(_run_partition, self._split(), chunksize=self._chunk_size))
+
+        # AlertEventは最初に失敗したマージで止まるため、そのマージで見つからなかったimeiだけを入力順に報告する
+        failed = [result for result in results if result.failed_merge is not None]
+        if failed:
+            first = min(result.failed_merge for result in failed)
+            unmatched = sorted(item for result in failed if result.failed_merge == first for item in result.unmatched)
+            if self._merges[first].strict:
+                # strictなら、入力上で最初に見つからなかった1件だけを報告する
+                unmatched = unmatched[:1]
+            raise DeviceNotFoundError(dict.fromkeys(imei for _, imei in unmatched))
+
+        runs = [result.alerts for result in results]
+        if self._sort:
+            merged = heapq.merge(*runs, key=_sort_key, reverse=True)
+        else:
+            merged = heapq.merge(*runs, key=lambda x: x[0])
+        return [alert for _, alert in merged]
+
+
+def benchmark_scaling(size: int = 400_000, device_count: int = 50_000, max_workers: Optional[int] = None) -> None:
+    """ワーカー数を1からNまで増やしたときの処理時間と速度向上率を表示する"""
+    max_workers = max_workers or os.cpu_count() or 1
+    devices = [{'imei': f'imei-{i}', 'label': f'label-{i}', 'device_type': f'type-{i % 5}'}
+               for i in range(device_count)]
+    alerts = [{'event_id': i, 'event_type': 1 + i % 2, 'imei': f'imei-{i % device_count}'} for i in range(size)]
+
+    start = time.perf_counter()
+    AlertEvent(alerts).merge_device_label(devices).merge_device_type(devices).sort_by_date_time().to_list()
+    baseline = time.perf_counter() - start
+    print(f'AlertEvent: {baseline:.3f} sec')
+
+    print('workers   seconds   speedup')
+    workers = 1
+    while True:
+        start = time.perf_counter()
+        ParallelAlertEvent(alerts, workers=workers) \
+            .merge_device_label(devices).merge_device_type(devices) \
+            .sort_by_date_time() \
+            .to_list()
+        elapsed = time.perf_counter() - start
+        print(f'{workers:<9} {elapsed:<9.3f} {baseline / elapsed:.2f}x')
+        if workers >= max_workers:
+            break
+        workers = min(workers * 2, max_workers)
+
+
+if __name__ == '__main__':
+    __alert_event = [
+        {'event_id': 1, 'event_type': 1, 'imei': 'a0001'},
+        {'event_id': 2, 'event_type': 2, 'imei': 'b0001'},
+    ]
+    __device_list_1 = [{'imei': 'a0001', 'label': 'label-1'}, {'imei': 'b0001', 'label': 'label-2'}]
+    __device_list_2 = [{'imei': 'a0001', 'device_type': 'type-1'}, {'imei': 'b0001', 'device_type': 'type-2'}]
+
+    print(
+        ParallelAlertEvent(__alert_event, workers=2)
+        .filter_latest_alert()
+        .merge_device_label(__device_list_1).merge_device_type(__device_list_2)
+        .sort_by_date_time()
+        .to_list()
+    )
+
+    benchmark_scaling()
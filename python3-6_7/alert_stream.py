@@ -0,0 +1,180 @@
+"""
+AlertEventのストリーミング版
+アラートをリストに読み込まず、イテレータ（またはJSONLファイル）から1件ずつ流して処理する。
+各ステージはジェネレータの変換として繋がり、to_list()/to_jsonl()で取り出すまで実行されない。
+ソートはメモリ上限（件数）を超えると、一時ディレクトリにソート済みの塊を書き出して外部マージソートに切り替える。
+"""
+import heapq
+import itertools
+import json
+import os
+import tempfile
+from typing import IO, Dict, Iterable, Iterator, List, Tuple, Union
+
+from alert import DeviceIndex, DeviceNotFoundError, dump_alerts
+
+
+def _read_jsonl(path: str) -> Iterator[dict]:
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _write_jsonl(path: str, alerts: Iterable[dict]) -> int:
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for alert in alerts:
+            f.write(json.dumps(alert, ensure_ascii=False))
+            f.write('\n')
+            count += 1
+    return count
+
+
+def _map_event_type(alerts: Iterable[dict]) -> Iterator[dict]:
+    for source in alerts:
+        # 呼び出し元のdictは書き換えず、1件ずつ浅いコピーを作る
+        alert = dict(source)
+        alert['event_type'] = 'option' if alert['event_type'] == 1 else 'crash'
+        yield alert
+
+
+def _filter_latest(alerts: Iterable[dict], k: int) -> Iterator[dict]:
+    if k < 1:
+        raise ValueError(f'k must be positive. k={k}')
+    # 保持するのはimeiごとのk件だけなので、メモリはデバイス数 × kで抑えられる
+    heaps: Dict[str, List[Tuple[int, int, dict]]] = {}
+    for seq, alert in enumerate(alerts):
+        heap = heaps.setdefault(alert['imei'], [])
+        if len(heap) < k:
+            heapq.heappush(heap, (alert['event_id'], seq, alert))
+        else:
+            heapq.heappushpop(heap, (alert['event_id'], seq, alert))
+    for _, _, alert in sorted((item for heap in heaps.values() for item in heap), key=lambda x: x[1]):
+        yield alert
+
+
+def _merge_device(alerts: Iterable[dict], index: DeviceIndex, key: str, strict: bool) -> Iterator[dict]:
+    unmatched: Dict[str, None] = {}
+    for alert in alerts:
+        device = index.get(alert['imei'])
+        if device is None:
+            if strict:
+                raise DeviceNotFoundError([alert['imei']])
+            unmatched[alert['imei']] = None
+            continue
+        alert[key] = device[key]
+        yield alert
+    if unmatched:
+        raise DeviceNotFoundError(unmatched)
+
+
+def _check_memory_budget(memory_budget: int) -> None:
+    if memory_budget < 1:
+        raise ValueError(f'memory_budget must be positive. memory_budget={memory_budget}')
+
+
+def _sort_by_label(alerts: Iterable[dict], memory_budget: int) -> Iterator[dict]:
+    def sort_key(x):
+        return x['label']
+
+    iterator = iter(alerts)
+    chunk = list(itertools.islice(iterator, memory_budget))
+    peeked = list(itertools.islice(iterator, 1))
+    if not peeked:
+        # 上限に収まる場合は、通常どおりメモリ上でソートする
+        chunk.sort(key=sort_key, reverse=True)
+        yield from chunk
+        return
+    iterator = itertools.chain(peeked, iterator)
+
+    # 上限を超える場合は、ソート済みの塊をファイルに書き出してからk-wayマージする
+    with tempfile.TemporaryDirectory(prefix='alert-sort-') as tmp_dir:
+        run_paths = []
+        while chunk:
+            chunk.sort(key=sort_key, reverse=True)
+            run_path = os.path.join(tmp_dir, f'run-{len(run_paths)}.jsonl')
+            _write_jsonl(run_path, chunk)
+            run_paths.append(run_path)
+            chunk = list(itertools.islice(iterator, memory_budget))
+        # heapq.mergeは同じキーなら先の塊を優先するため、ソートの安定性も保たれる
+        yield from heapq.merge(*(_read_jsonl(path) for path in run_paths), key=sort_key, reverse=True)
+
+
+class StreamingAlertEvent:
+    """
+    ストリーミングで処理するAlertEvent
+    入力は1回しか読まないため、to_list()かto_jsonl()はどちらか1回だけ呼べる。
+    """
+
+    def __init__(self, alert_events: Iterable[dict], memory_budget: int = 100_000):
+        """
+        Args:
+            alert_events: アラートのイテレータ
+            memory_budget: ソート時にメモリ上に保持するアラートの最大件数（1以上）
+        """
+        _check_memory_budget(memory_budget)
+        self._stream: Iterator[dict] = _map_event_type(alert_events)
+        self._memory_budget = memory_budget
+
+    @classmethod
+    def from_jsonl(cls, path: str, memory_budget: int = 100_000) -> 'StreamingAlertEvent':
+        _check_memory_budget(memory_budget)
+        return cls(_read_jsonl(path), memory_budget)
+
+    def filter_latest_alert(self, k: int = 1):
+        self._stream = _filter_latest(self._stream, k)
+        return self
+
+    def merge_device_label(self, device_list: Union[List[dict], DeviceIndex], strict: bool = True):
+        return self._merge_device(device_list, 'label', strict)
+
+    def merge_device_type(self, device_list: Union[List[dict], DeviceIndex], strict: bool = True):
+        return self._merge_device(device_list, 'device_type', strict)
+
+    def _merge_device(self, device_list: Union[List[dict], DeviceIndex], key: str, strict: bool = True):
+        index = device_list if isinstance(device_list, DeviceIndex) else DeviceIndex(device_list)
+        self._stream = _merge_device(self._stream, index, key, strict)
+        return self
+
+    def sort_by_date_time(self):
+        self._stream = _sort_by_label(self._stream, self._memory_budget)
+        return self
+
+    def __iter__(self) -> Iterator[dict]:
+        return self._stream
+
+    def to_list(self) -> List[dict]:
+        return list(self._stream)
+
+    def to_jsonl(self, path: str) -> int:
+        """結果を1行1アラートのJSONLで書き出し、書き出した件数を返す"""
+        return _write_jsonl(path, self._stream)
+
+    def dump(self, fp: IO, jsonl: bool = False, compact: bool = False, compress: bool = False,
+             chunk_size: int = 1000) -> int:
+        """結果をJSON配列・JSONLでファイルオブジェクトに書き出す。引数はdump_alertsと同じ"""
+        return dump_alerts(self._stream, fp, jsonl, compact, compress, chunk_size)
+
+
+if __name__ == '__main__':
+    __device_list_1 = [{'imei': f'imei-{i}', 'label': f'label-{i}'} for i in range(100)]
+    __device_list_2 = [{'imei': f'imei-{i}', 'device_type': f'type-{i % 3}'} for i in range(100)]
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_path = os.path.join(work_dir, 'alerts.jsonl')
+        output_path = os.path.join(work_dir, 'merged.jsonl')
+        _write_jsonl(input_path, ({'event_id': i, 'event_type': 1 + i % 2, 'imei': f'imei-{i % 100}'}
+                                  for i in range(10_000)))
+
+        # memory_budgetを小さくして、外部マージソートに切り替わるようにする
+        count = (
+            StreamingAlertEvent.from_jsonl(input_path, memory_budget=1_000)
+            .merge_device_label(__device_list_1).merge_device_type(__device_list_2)
+            .sort_by_date_time()
+            .to_jsonl(output_path)
+        )
+        print(f'{count} alerts written.')
+        with open(output_path, encoding='utf-8') as f:
+            for line in itertools.islice(f, 3):
+                print(line, end='')